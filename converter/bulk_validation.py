@@ -0,0 +1,132 @@
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+
+from json_codec import dumps, read_json_file
+from schema_codegen import FastValidationError
+from schema_container import (
+    ValidatorMismatchError,
+    check_validators_agree,
+    get_document_schema_name,
+    get_fast_validator,
+    get_validator,
+    load_schema,
+)
+
+# names of the documents searched for in directories, compared case-insensitively
+DOCUMENT_NAMES = {"dataset.json", "experiment.json"}
+# documents sent to a worker process at once
+CHUNK_SIZE = 32
+# chunks submitted for each worker process at a time
+CHUNKS_PER_JOB = 2
+
+
+def find_documents(paths: Iterable[Path]) -> Iterator[Path]:
+    """Yields files from paths as they are,
+    and dataset.json and experiment.json files found in the directories of paths
+    """
+    for path in paths:
+        if not path.is_dir():
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower() in DOCUMENT_NAMES:
+                    yield Path(root) / name
+
+
+def read_file_list(list_path: Path) -> List[Path]:
+    """Reads paths listed one per line, empty lines are skipped"""
+    with open(list_path, "r", encoding="utf-8") as s:
+        return [Path(line.strip()) for line in s if line.strip() != ""]
+
+
+def format_error_path(path: Iterable[Any]) -> str:
+    """Formats path to the invalid value as json pointer"""
+    parts = (str(p).replace("~", "~0").replace("/", "~1") for p in path)
+    return "".join("/" + p for p in parts)
+
+
+def validate_document(doc_path: Path) -> Dict[str, Any]:
+    """Returns the report entry of the document with all validation errors"""
+    entry = {"document": str(doc_path), "schema": None, "valid": False, "errors": []}
+    try:
+        instance = read_json_file(doc_path)
+        schema_name = get_document_schema_name(instance)
+    except Exception as e:
+        entry["errors"].append({"path": "", "keyword": None, "message": str(e)})
+        return entry
+    entry["schema"] = schema_name
+
+    # the generated validator is much faster than jsonschema,
+    # jsonschema is only used to collect all errors of invalid documents
+    try:
+        get_fast_validator(schema_name)(instance)
+        entry["valid"] = True
+        return entry
+    except FastValidationError as e:
+        fast_error = e
+
+    validator = get_validator(schema_name, load_schema(schema_name))
+    errors = list(validator.iter_errors(instance))
+    try:
+        check_validators_agree(schema_name, fast_error, errors)
+    except ValidatorMismatchError as e:
+        entry["errors"].append({"path": "", "keyword": None, "message": str(e)})
+    for error in errors:
+        entry["errors"].append(
+            {
+                "path": format_error_path(error.absolute_path),
+                "keyword": error.validator,
+                "message": error.message,
+            }
+        )
+    entry["valid"] = False
+    return entry
+
+
+def iter_chunks(doc_paths: Iterable[Path], size: int) -> Iterator[List[Path]]:
+    chunk = []
+    for doc_path in doc_paths:
+        chunk.append(doc_path)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk != []:
+        yield chunk
+
+
+def validate_documents(doc_paths: List[Path]) -> List[Dict[str, Any]]:
+    return [validate_document(doc_path) for doc_path in doc_paths]
+
+
+def iter_validation_results(
+    doc_paths: Iterable[Path], jobs: int = 1
+) -> Iterator[Dict[str, Any]]:
+    """Yields report entries of the documents in the order of completion.
+    Only a few chunks are submitted at a time, so the documents are searched for
+    while the found ones are validated and a large tree is not held in memory.
+    """
+    if jobs <= 1:
+        for doc_path in doc_paths:
+            yield validate_document(doc_path)
+        return
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    chunks = iter_chunks(doc_paths, CHUNK_SIZE)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        running = set()
+        chunk = next(chunks, None)
+        while chunk is not None or running:
+            while chunk is not None and len(running) < jobs * CHUNKS_PER_JOB:
+                running.add(executor.submit(validate_documents, chunk))
+                chunk = next(chunks, None)
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+def write_report_entry(report_stream, entry: Dict[str, Any]):
+    report_stream.write(dumps(entry) + "\n")
+    report_stream.flush()
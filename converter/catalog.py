@@ -0,0 +1,100 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from json_codec import dumps
+from records import (
+    BOOLEAN,
+    INTEGER,
+    NUMBER,
+    STRING,
+    ChannelDetails,
+    ExperimentMetadata,
+    Missing2Metadata,
+)
+
+CATALOG_NAME = "catalog.sqlite"
+SQL_TYPES = {STRING: "TEXT", INTEGER: "INTEGER", NUMBER: "REAL", BOOLEAN: "INTEGER"}
+
+# top level fields of dataset.json that are not flat values, stored as json text
+JSON_FIELDS = (
+    "NuclearStain",
+    "MembraneStain",
+    "NuclearStainForSegmentation",
+    "MembraneStainForSegmentation",
+)
+DATASET_FIELDS = {**Missing2Metadata._fields, **ExperimentMetadata._fields}
+CHANNEL_FIELDS = ChannelDetails._fields
+
+
+def get_catalog_path(workdir: Path) -> Path:
+    return workdir / CATALOG_NAME
+
+
+def get_create_statements() -> List[str]:
+    dataset_columns = [f"{f} {SQL_TYPES[t]}" for f, t in DATASET_FIELDS.items()]
+    dataset_columns.extend(f"{f} TEXT" for f in JSON_FIELDS)
+    channel_columns = [f"{f} {SQL_TYPES[t]}" for f, t in CHANNEL_FIELDS.items()]
+    return [
+        "CREATE TABLE IF NOT EXISTS datasets ("
+        + "InputDir TEXT PRIMARY KEY, OutputDir TEXT, ConvertedAt TEXT, "
+        + ", ".join(dataset_columns)
+        + ")",
+        "CREATE TABLE IF NOT EXISTS channels ("
+        + "InputDir TEXT NOT NULL REFERENCES datasets (InputDir) ON DELETE CASCADE, "
+        + ", ".join(channel_columns)
+        + ", PRIMARY KEY (InputDir, CycleID, ChannelID))",
+        "CREATE INDEX IF NOT EXISTS datasets_name ON datasets (DatasetName)",
+        "CREATE INDEX IF NOT EXISTS channels_marker ON channels (Name)",
+        "CREATE INDEX IF NOT EXISTS channels_fluorophore ON channels (Fluorophore)",
+        "CREATE INDEX IF NOT EXISTS channels_cycle ON channels (CycleID, ChannelID)",
+    ]
+
+
+def open_catalog(catalog_path: Path) -> sqlite3.Connection:
+    """Opens the catalog and creates the tables if they do not exist"""
+    # locks of SQLite are not reliable on network shares, so --distributed
+    # workers do not write the catalog. Another run on the same computer
+    # can write to it, wait for its transactions.
+    conn = sqlite3.connect(str(catalog_path), timeout=60)
+    conn.execute("PRAGMA foreign_keys = ON")
+    with conn:
+        for statement in get_create_statements():
+            conn.execute(statement)
+    return conn
+
+
+def upsert_dataset(
+    conn: sqlite3.Connection,
+    input_dir: Path,
+    out_dir: Path,
+    metadata: Dict[str, Any],
+):
+    """Replaces the dataset and its channels in one transaction"""
+    dataset_row = [str(input_dir), str(out_dir), time.strftime("%Y-%m-%dT%H:%M:%S")]
+    dataset_row.extend(metadata.get(f) for f in DATASET_FIELDS)
+    dataset_row.extend(dumps(metadata.get(f)) for f in JSON_FIELDS)
+    dataset_columns = ["InputDir", "OutputDir", "ConvertedAt"]
+    dataset_columns.extend(DATASET_FIELDS)
+    dataset_columns.extend(JSON_FIELDS)
+
+    channels = metadata.get("ChannelDetails", dict()).get("ChannelDetailsArray", [])
+    channel_rows = [
+        [str(input_dir)] + [channel.get(f) for f in CHANNEL_FIELDS]
+        for channel in channels
+    ]
+    channel_columns = ["InputDir"] + list(CHANNEL_FIELDS)
+
+    with conn:
+        conn.execute("DELETE FROM channels WHERE InputDir = ?", (str(input_dir),))
+        conn.execute(
+            f"INSERT OR REPLACE INTO datasets ({', '.join(dataset_columns)}) "
+            + f"VALUES ({', '.join('?' * len(dataset_columns))})",
+            dataset_row,
+        )
+        conn.executemany(
+            f"INSERT INTO channels ({', '.join(channel_columns)}) "
+            + f"VALUES ({', '.join('?' * len(channel_columns))})",
+            channel_rows,
+        )
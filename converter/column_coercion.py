@@ -0,0 +1,52 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# characters stripped from both ends of every value, same as read_str in converter
+STRIP_CHARS = ",.\r\n\t '\""
+
+
+def to_str_column(values: List[str]) -> np.ndarray:
+    return np.char.strip(np.array(values, dtype=str), STRIP_CHARS)
+
+
+def parse_bool_column(column: np.ndarray) -> np.ndarray:
+    # same as read_bool, everything except "true" is False
+    return np.char.lower(column) == "true"
+
+
+def find_invalid_ints(column: np.ndarray) -> np.ndarray:
+    """Returns mask of values that int() would reject:
+    anything but decimal digits with an optional leading sign
+    """
+    unsigned = np.char.lstrip(column, "+-")
+    num_signs = np.char.str_len(column) - np.char.str_len(unsigned)
+    return ~(np.char.isdecimal(unsigned) & (num_signs <= 1))
+
+
+def coerce_columns(
+    columns: Dict[str, List[str]], dtypes: Dict[str, type]
+) -> Tuple[Dict[str, np.ndarray], List[Tuple[int, str, str]]]:
+    """Strips all values and converts columns to the requested types.
+    Returns ({column: array}, [(row, column, value)] of cells that could not be
+    converted), rows are counted from 1 for the first row after the header.
+    """
+    coerced = dict()
+    bad_cells = []
+    for col, dtype in dtypes.items():
+        column = to_str_column(columns[col])
+        if dtype is bool:
+            coerced[col] = parse_bool_column(column)
+        elif dtype is int:
+            invalid = find_invalid_ints(column)
+            for r in np.flatnonzero(invalid):
+                bad_cells.append((int(r) + 1, col, str(column[r])))
+            coerced[col] = np.where(invalid, "0", column).astype(np.int64)
+        else:
+            coerced[col] = column
+    bad_cells.sort()
+    return coerced, bad_cells
+
+
+def format_bad_cells(bad_cells: List[Tuple[int, str, str]]) -> str:
+    return ", ".join(f"row {r} column {col} value '{val}'" for r, col, val in bad_cells)
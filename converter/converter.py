@@ -1,20 +1,110 @@
 import argparse
-import json
 import logging
+import os
 import re
+import sys
+import time
 import traceback
 import xml.etree.ElementTree as ET
-from glob import glob
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
 from pathlib import Path
-from typing import Any, Dict, List, Tuple, Union
-
-import jsonschema
-import numpy as np
-import pandas as pd
-from packaging import version
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, NamedTuple, Tuple, Union
 
 from dataset_listing import create_listing_for_each_cycle_region
-from schema_container import dataset_schema, get_experiment_metadata_schema
+from json_codec import read_json_file, write_json_file
+from deadlines import (
+    KILL_GRACE,
+    cancel_dataset,
+    check_deadline,
+    configure_deadlines,
+    has_timed_out,
+    start_dataset,
+    start_stage,
+)
+from io_limits import (
+    DatasetDispatcher,
+    DeviceThrottle,
+    IOConfig,
+    RateLimiter,
+    add_reported_summaries,
+    configure_io_limits,
+    create_rate_limiter,
+    create_throttles,
+    format_limits,
+    get_adaptive_summaries,
+    get_devices,
+    get_mount_limits,
+    get_reported_summaries,
+    limit_file_read,
+    limit_read,
+    load_io_config,
+    lower_io_priority,
+    map_reads,
+)
+from journal import (
+    get_completed_datasets,
+    get_journal_path,
+    record_batch_start,
+    record_outcome,
+)
+from progress import (
+    ProgressReporter,
+    ProgressStreamHandler,
+    add_progress,
+    configure_counters,
+    create_shared_counters,
+    detach_reporter,
+    format_bytes,
+    format_duration,
+)
+from records import (
+    ChannelDetails,
+    ExperimentMetadata,
+    Missing2Metadata,
+    SegmentationMetadata,
+    StainChannel,
+    records_to_dicts,
+)
+from scheduling import (
+    SCHEDULES,
+    DatasetCost,
+    estimate_costs,
+    estimate_makespan,
+    get_seconds,
+    order_datasets,
+)
+from schema_container import get_experiment_metadata_schema_name, validate
+from sidecar_cache import (
+    MAX_CACHE_ENTRIES,
+    cached_read,
+    configure_cache,
+    get_shared_cache_dir,
+)
+from table_reader import read_table_rows
+from work_queue import (
+    claim_task,
+    complete_task,
+    count_tasks,
+    get_failed_tasks,
+    get_queue_dir,
+    get_worker_id,
+    init_queue,
+    merge_reports,
+    requeue_claimed_tasks,
+)
+from xlsx_reader import cell_to_str, is_missing, read_xlsx_rows, select_columns
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from dataset_probe import DatasetInventory
+
+logger = logging.getLogger(__name__)
 
 
 def make_dir_if_not_exists(dir_path: Path):
@@ -23,26 +113,8 @@ def make_dir_if_not_exists(dir_path: Path):
 
 
 def read_json(path: Path) -> dict:
-    with open(path, "r") as s:
-        j = json.load(s)
-    return j
-
-
-def read_bool(in_str: str) -> bool:
-    if isinstance(in_str, bool):
-        return in_str
-    if in_str.lower().strip() == "true":
-        return True
-    else:
-        return False
-
-
-def str_list_to_bools(str_list: List[str]) -> List[bool]:
-    return [read_bool(b) for b in str_list]
-
-
-def np_dtype_to_py_dtype(np_val):
-    return np_val.item()
+    with limit_file_read(path):
+        return read_json_file(path)
 
 
 def is_number(in_str: str):
@@ -57,10 +129,6 @@ def read_str(in_str: str) -> str:
     return in_str.strip(",.\r\n\t '\"")
 
 
-def str_list_strip(str_list: List[str]):
-    return [read_str(st) for st in str_list]
-
-
 def str_list_to_paths(str_list: List[str]):
     return [Path(read_str(p)) for p in str_list]
 
@@ -76,45 +144,6 @@ def read_int_if_can(in_str: str) -> Union[int, str]:
         return in_str
 
 
-def get_experiment_json_name(dataset_path: Path) -> str:
-    variants = (r"experiment\.json", r"Experiment\.json")
-    listing = list(dataset_path.iterdir())
-    found = []
-    for item in listing:
-        for var in variants:
-            matched = re.match(var, item.name)
-            if matched:
-                found.append(matched.string)
-    if len(found) > 1:
-        msg = "Found several options of experiment file: " + str(variants)
-        raise ValueError(msg)
-    elif len(found) == 0:
-        msg = "File experiment json is not found."
-        raise ValueError(msg)
-    else:
-        return found[0]
-
-
-def check_other_metadata_present(dataset_path: Path):
-    required_files = [
-        "segmentation.json",
-        "missing1.xlsx",
-        "missing2.xlsx",
-    ]
-    absent_files = []
-    for f in required_files:
-        fp = dataset_path / f
-        if not fp.exists():
-            absent_files.append(f)
-    if len(absent_files) > 0:
-        msg = (
-            f"The following required metadata files are absent {str(absent_files)}. "
-            + f" These files {str(required_files)}"
-            + f" must be present in the specified dataset folder {str(dataset_path)}"
-        )
-        raise FileNotFoundError(msg)
-
-
 def alpha_num_order(string: str) -> str:
     """Returns all numbers on 5 digits to let sort the string with numeric order.
     Ex: alpha_num_order("a6b12.125")  ==> "a00006b00012.00125"
@@ -127,16 +156,6 @@ def alpha_num_order(string: str) -> str:
     )
 
 
-def get_img_dirs(dataset_path: Path) -> List[Path]:
-    img_dirs = glob(str(dataset_path / "?yc*_?eg*"))
-    if img_dirs == []:
-        msg = "No directories with images found. They must follow this pattern cyc001_reg001"
-        raise ValueError(msg)
-    img_dirs = sorted(img_dirs, key=alpha_num_order)
-    img_dirs = [Path(p) for p in img_dirs]
-    return img_dirs
-
-
 def get_img_listing(in_dir: Path) -> List[Path]:
     allowed_extensions = (".tif", ".tiff")
     listing = list(in_dir.iterdir())
@@ -145,9 +164,20 @@ def get_img_listing(in_dir: Path) -> List[Path]:
     return img_listing
 
 
+def scan_image_dirs(inventory: "DatasetInventory") -> dict:
+    start_stage("listing")
+    img_dirs = inventory.get_img_dirs()
+    listing = create_listing_for_each_cycle_region(img_dirs)
+    return listing
+
+
 def extract_keyence_metadata(img_path: Path) -> ET.Element:
     with open(img_path, "r", encoding="utf-8", errors="ignore") as s:
-        img_data = s.read()
+        file_stat = os.fstat(s.fileno())
+        with limit_read(file_stat.st_dev, file_stat.st_size):
+            img_data = s.read()
+        add_progress("bytes", file_stat.st_size)
+    add_progress("headers")
 
     # search for xml declaration  '<?xml version="1.0" encoding="utf-8"?>'
     match = re.search(r"<\?xml.*\?>", img_data)
@@ -210,22 +240,9 @@ def convert_immersion_medium(imm_med: str):
         raise ValueError(msg)
 
 
-class ChannelDetails:
-    def __init__(self):
-        self.Name = ""
-        self.CycleID = 1
-        self.ChannelID = 1
-        self.Fluorophore = ""
-        self.PassedQC = False
-        self.QCDetails = ""
-        self.ExposureTimeMS = 1
-        self.ExcitationWavelengthNM = 1
-        self.EmissionWavelengthNM = 1
-        self.Binning = 1
-        self.Gain = 1
-
-
-def read_missing2(missing2_meta_path: Path) -> pd.DataFrame:
+def read_missing2(
+    missing2_meta_path: Path, data: Union[None, bytes] = None
+) -> Dict[str, Any]:
     fields = [
         "Version",
         "AcquisitionDate",
@@ -236,24 +253,30 @@ def read_missing2(missing2_meta_path: Path) -> pd.DataFrame:
         "MicroscopeName",
     ]
 
-    m2 = pd.read_excel(missing2_meta_path, header=None, index_col=0, usecols=[0, 1])
-    m2 = m2.dropna(axis=0)
-    clean_index = [read_str(row_name) for row_name in m2.index]
+    rows = read_table_rows(missing2_meta_path, max_cols=2, data=data)
+    m2 = dict()
+    for row_name, value in rows:
+        if is_missing(value):
+            continue
+        m2[read_str(cell_to_str(row_name))] = value
 
     absent_fields = []
     for f in fields:
-        if f not in clean_index:
+        if f not in m2:
             absent_fields.append(f)
 
     if absent_fields != []:
-        msg = f"These fields {str(absent_fields)} are absent in the missing2.xlsx"
+        msg = f"These fields {str(absent_fields)} are absent in the {missing2_meta_path.name}"
         raise ValueError(msg)
 
-    m2.index = clean_index
     return m2
 
 
-def read_missing1(missing1_meta_path: Path, total_num_channels: int) -> pd.DataFrame:
+def read_missing1(
+    missing1_meta_path: Path, total_num_channels: int, data: Union[None, bytes] = None
+) -> Dict[str, "np.ndarray"]:
+    from column_coercion import coerce_columns, format_bad_cells
+
     cols = [
         "Marker",
         "Fluorophore",
@@ -264,22 +287,25 @@ def read_missing1(missing1_meta_path: Path, total_num_channels: int) -> pd.DataF
         "IsNuclearMarker",
         "IsMembraneMarker",
     ]
-    m1 = pd.read_excel(
-        missing1_meta_path, header=0, usecols=cols, dtype=str, nrows=total_num_channels
+    rows = read_table_rows(
+        missing1_meta_path, max_rows=total_num_channels + 1, data=data
     )
+    absent_cols, columns = select_columns(rows, cols)
+    if absent_cols != []:
+        msg = f"These columns {str(absent_cols)} are absent in the {missing1_meta_path.name}"
+        raise ValueError(msg)
 
-    if m1.isna().sum().sum() > 0:
-        rows_with_missing = m1.index[m1.isna().any(axis=1)]
-        rows_with_missing = [r + 1 for r in rows_with_missing]
+    num_rows = len(rows) - 1
+    rows_with_missing = [
+        r + 1 for r in range(num_rows) if any(is_missing(c[r]) for c in columns)
+    ]
+    if rows_with_missing != []:
         msg = (
-            "The file missing1.xlsx contains empty or missing values."
+            f"The file {missing1_meta_path.name} contains empty or missing values."
             + f" Please check the following rows: {str(rows_with_missing)}"
         )
         raise ValueError(msg)
 
-    for col in cols:
-        m1[col] = str_list_strip(m1[col].to_list())
-
     dtypes = {
         "Marker": str,
         "Fluorophore": str,
@@ -290,109 +316,141 @@ def read_missing1(missing1_meta_path: Path, total_num_channels: int) -> pd.DataF
         "IsNuclearMarker": bool,
         "IsMembraneMarker": bool,
     }
-    for col, dtype in dtypes.items():
-        if dtype is bool:
-            m1[col] = str_list_to_bools(m1[col].to_list())
-        else:
-            m1[col] = m1[col].astype(dtype)
+    str_columns = {col: [cell_to_str(v) for v in c] for col, c in zip(cols, columns)}
+    m1, bad_cells = coerce_columns(str_columns, dtypes)
+    if bad_cells != []:
+        msg = (
+            f"The file {missing1_meta_path.name} contains values"
+            + " that are not whole numbers."
+            + f" Please check the following cells: {format_bad_cells(bad_cells)}"
+        )
+        raise ValueError(msg)
     return m1
 
 
-def map_segmentation_meta(seg_metadata: dict) -> Dict[str, Dict[str, int]]:
-    mapped_seg_meta = {
-        "NuclearStainForSegmentation": {
-            "CycleID": seg_metadata["nuclearStainCycle"],
-            "ChannelID": seg_metadata["nuclearStainChannel"],
-        },
-        "MembraneStainForSegmentation": {
-            "CycleID": seg_metadata["membraneStainCycle"],
-            "ChannelID": seg_metadata["membraneStainChannel"],
-        },
-    }
+def map_segmentation_meta(seg_metadata: dict) -> SegmentationMetadata:
+    mapped_seg_meta = SegmentationMetadata(
+        NuclearStainForSegmentation=StainChannel(
+            CycleID=seg_metadata["nuclearStainCycle"],
+            ChannelID=seg_metadata["nuclearStainChannel"],
+        ),
+        MembraneStainForSegmentation=StainChannel(
+            CycleID=seg_metadata["membraneStainCycle"],
+            ChannelID=seg_metadata["membraneStainChannel"],
+        ),
+    )
     return mapped_seg_meta
 
 
-def map_experiment_meta(exp_metadata: dict) -> Dict[str, Any]:
+def map_experiment_meta(exp_metadata: dict) -> ExperimentMetadata:
+    from packaging import version
+
     ver = exp_metadata["version"]
     if version.parse(ver) >= version.parse("1.7") < version.parse("1.8"):
         bit_depth_key = "bitDepth"
     elif version.parse(ver) >= version.parse("1.5") < version.parse("1.7"):
         bit_depth_key = "bitness"
 
-    mapped_exp_meta = {
-        "ImmersionMedium": convert_immersion_medium(exp_metadata["objectiveType"]),
-        "NominalMagnification": exp_metadata["magnification"],
-        "NumericalAperture": exp_metadata["aperture"],
-        "ResolutionX": exp_metadata["xyResolution"],
-        "ResolutionXUnit": "nm",
-        "ResolutionY": exp_metadata["xyResolution"],
-        "ResolutionYUnit": "nm",
-        "ResolutionZ": exp_metadata["zPitch"],
-        "ResolutionZUnit": "nm",
-        "BitDepth": exp_metadata[bit_depth_key],
-        "NumRegions": exp_metadata["numRegions"],
-        "NumCycles": exp_metadata["numCycles"],
-        "NumZPlanes": exp_metadata["numZPlanes"],
-        "NumChannels": exp_metadata["numChannels"],
-        "RegionWidth": exp_metadata["regionWidth"],
-        "RegionHeight": exp_metadata["regionHeight"],
-        "TileWidth": exp_metadata["tileWidth"],
-        "TileHeight": exp_metadata["tileHeight"],
-        "TileOverlapX": exp_metadata["tileOverlapX"],
-        "TileOverlapY": exp_metadata["tileOverlapY"],
-        "TileLayout": convert_tiling_mode(exp_metadata["tilingMode"]),
-    }
+    mapped_exp_meta = ExperimentMetadata(
+        ImmersionMedium=convert_immersion_medium(exp_metadata["objectiveType"]),
+        NominalMagnification=exp_metadata["magnification"],
+        NumericalAperture=exp_metadata["aperture"],
+        ResolutionX=exp_metadata["xyResolution"],
+        ResolutionXUnit="nm",
+        ResolutionY=exp_metadata["xyResolution"],
+        ResolutionYUnit="nm",
+        ResolutionZ=exp_metadata["zPitch"],
+        ResolutionZUnit="nm",
+        BitDepth=exp_metadata[bit_depth_key],
+        NumRegions=exp_metadata["numRegions"],
+        NumCycles=exp_metadata["numCycles"],
+        NumZPlanes=exp_metadata["numZPlanes"],
+        NumChannels=exp_metadata["numChannels"],
+        RegionWidth=exp_metadata["regionWidth"],
+        RegionHeight=exp_metadata["regionHeight"],
+        TileWidth=exp_metadata["tileWidth"],
+        TileHeight=exp_metadata["tileHeight"],
+        TileOverlapX=exp_metadata["tileOverlapX"],
+        TileOverlapY=exp_metadata["tileOverlapY"],
+        TileLayout=convert_tiling_mode(exp_metadata["tilingMode"]),
+    )
     return mapped_exp_meta
 
 
+def get_cycle_and_channel_ids(
+    num_channels: int, num_channels_per_cycle: int
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Rows of missing1 are ordered by cycle, then by channel, both starting from 1"""
+    import numpy as np
+
+    row_ids = np.arange(num_channels)
+    cycle_ids = row_ids // num_channels_per_cycle + 1
+    channel_ids = row_ids % num_channels_per_cycle + 1
+    return cycle_ids, channel_ids
+
+
 def get_nuc_and_membr_markers(
-    m1: pd.DataFrame, num_channels_per_cycle: int, seg_meta: dict
+    m1: Dict[str, "np.ndarray"],
+    num_channels_per_cycle: int,
+    seg_meta: SegmentationMetadata,
+    missing1_name: str = "missing1.xlsx",
 ) -> Tuple[Dict[str, List[Dict[str, int]]], Dict[str, List[Dict[str, int]]]]:
-    nuclear_stain = {"NuclearStain": []}
-    membrane_stain = {"MembraneStain": []}
-    ch_i = 1
-    for i, _id in enumerate(m1.index):
-        this_channel_info = m1.loc[_id, :]
-        is_nuc_marker = np_dtype_to_py_dtype(this_channel_info["IsNuclearMarker"])
-        is_memb_maker = np_dtype_to_py_dtype(this_channel_info["IsMembraneMarker"])
-
-        channel_id = ch_i
-        cycle_id = (i // num_channels_per_cycle) + 1
-
-        if is_nuc_marker:
-            nuclear_stain["NuclearStain"].append(
-                {"CycleID": cycle_id, "ChannelID": channel_id}
+    cycle_ids, channel_ids = get_cycle_and_channel_ids(
+        len(m1["Marker"]), num_channels_per_cycle
+    )
+    is_nuc_marker = m1["IsNuclearMarker"]
+    # channel marked as both nuclear and membrane is counted as nuclear
+    is_memb_marker = m1["IsMembraneMarker"] & ~is_nuc_marker
+
+    nuclear_stain = {
+        "NuclearStain": [
+            {"CycleID": cyc, "ChannelID": ch}
+            for cyc, ch in zip(
+                cycle_ids[is_nuc_marker].tolist(), channel_ids[is_nuc_marker].tolist()
             )
-        elif is_memb_maker:
-            membrane_stain["MembraneStain"].append(
-                {"CycleID": cycle_id, "ChannelID": channel_id}
+        ]
+    }
+    membrane_stain = {
+        "MembraneStain": [
+            {"CycleID": cyc, "ChannelID": ch}
+            for cyc, ch in zip(
+                cycle_ids[is_memb_marker].tolist(),
+                channel_ids[is_memb_marker].tolist(),
             )
-
-        if ch_i == num_channels_per_cycle:
-            ch_i = 1
-        else:
-            ch_i += 1
+        ]
+    }
     if nuclear_stain["NuclearStain"] == []:
-        msg = "Nuclear stain channels is not found in missing1.xlsx"
+        msg = f"Nuclear stain channels is not found in {missing1_name}"
         raise ValueError(msg)
     if membrane_stain["MembraneStain"] == []:
-        msg = "Membrane stain channel is not found in missing1.xlsx"
+        msg = f"Membrane stain channel is not found in {missing1_name}"
         raise ValueError(msg)
-    if not seg_meta["NuclearStainForSegmentation"] in nuclear_stain["NuclearStain"]:
-        msg = "Nuclear stain provided in segmentation.json is not present in missing1.xlsx"
+    nuc_seg_stain = seg_meta.NuclearStainForSegmentation.to_dict()
+    memb_seg_stain = seg_meta.MembraneStainForSegmentation.to_dict()
+    if not nuc_seg_stain in nuclear_stain["NuclearStain"]:
+        msg = (
+            "Nuclear stain provided in segmentation.json"
+            + f" is not present in {missing1_name}"
+        )
         raise ValueError(msg)
-    if not seg_meta["MembraneStainForSegmentation"] in membrane_stain["MembraneStain"]:
-        msg = "Membrane stain provided in segmentation.json is not present in missing1.xlsx"
+    if not memb_seg_stain in membrane_stain["MembraneStain"]:
+        msg = (
+            "Membrane stain provided in segmentation.json"
+            + f" is not present in {missing1_name}"
+        )
         raise ValueError(msg)
     return nuclear_stain, membrane_stain
 
 
 def read_exposure_times_table(
-    exposure_times_table_path: Path,
+    exposure_times_table_path: Union[None, Path],
 ) -> Union[None, List[List[Union[str, int]]]]:
-    if not exposure_times_table_path.exists():
+    if exposure_times_table_path is None:
         return None
-    exp_times = pd.read_csv(exposure_times_table_path, header=None)
+    import pandas as pd
+
+    with limit_file_read(exposure_times_table_path):
+        exp_times = pd.read_csv(exposure_times_table_path, header=None)
     exposure_times = []
     for row in range(0, len(exp_times)):
         this_cycle_exposure = exp_times.loc[row, :].to_list()
@@ -402,7 +460,8 @@ def read_exposure_times_table(
 
 
 def get_exposure_times(
-    exp_metadata: dict, exposure_times_table: Union[None, pd.DataFrame] = None
+    exp_metadata: dict,
+    exposure_times_table: Union[None, List[List[Union[str, int]]]] = None,
 ) -> List[List[Union[str, int]]]:
     if exp_metadata.get("exposureTimes", None) is not None:
         exposure_times = exp_metadata["exposureTimes"]["exposureTimesArray"]
@@ -419,83 +478,81 @@ def get_exposure_times(
 
 
 def create_channel_details(
-    m1: pd.DataFrame,
+    m1: Dict[str, "np.ndarray"],
     bin_list: List[int],
     gain_list: List[int],
     exposure_times: List[List[str]],
     num_channels_per_cycle: int,
 ) -> List[ChannelDetails]:
-    channel_list = []
-    n = 0
-    ch_i = 1
-    for i, _id in enumerate(m1.index):
-        this_channel_info = m1.loc[_id, :]
-
-        channel_id = ch_i
-        cycle_id = (i // num_channels_per_cycle) + 1
-
-        ch = ChannelDetails()
-        ch.Name = this_channel_info["Marker"]
-        ch.ChannelID = channel_id
-        ch.CycleID = cycle_id
-        ch.Fluorophore = this_channel_info["Fluorophore"]
-        ch.PassedQC = np_dtype_to_py_dtype(this_channel_info["PassedQC"])
-        ch.QCDetails = this_channel_info["QCDetails"]
-        ch.ExcitationWavelengthNM = np_dtype_to_py_dtype(
-            this_channel_info["ExcitationWavelength"]
-        )
-        ch.EmissionWavelengthNM = np_dtype_to_py_dtype(
-            this_channel_info["EmissionWavelength"]
-        )
+    import numpy as np
 
-        cycle_info = exposure_times[ch.CycleID]
-        exposure_time = int(cycle_info[ch.ChannelID])
-        ch.ExposureTimeMS = exposure_time
-        ch.Binning = bin_list[n]
-        ch.Gain = gain_list[n]
-
-        if ch_i == num_channels_per_cycle:
-            ch_i = 1
-        else:
-            ch_i += 1
-        n += 1
-        channel_list.append(ch)
+    num_channels = len(m1["Marker"])
+    cycle_ids, channel_ids = get_cycle_and_channel_ids(
+        num_channels, num_channels_per_cycle
+    )
+    # first row and column of the exposure times table are headers,
+    # so cycle and channel ids can be used as indices directly
+    row_len = max(len(row) for row in exposure_times)
+    exposure_table = np.array(
+        [list(row) + [None] * (row_len - len(row)) for row in exposure_times],
+        dtype=object,
+    )
+    exposure_times_ms = exposure_table[cycle_ids, channel_ids].astype(int)
+
+    columns = (
+        m1["Marker"].tolist(),
+        cycle_ids.tolist(),
+        channel_ids.tolist(),
+        m1["Fluorophore"].tolist(),
+        m1["PassedQC"].tolist(),
+        m1["QCDetails"].tolist(),
+        exposure_times_ms.tolist(),
+        m1["ExcitationWavelength"].tolist(),
+        m1["EmissionWavelength"].tolist(),
+        bin_list[:num_channels],
+        gain_list[:num_channels],
+    )
+    channel_list = [ChannelDetails(*values) for values in zip(*columns)]
     return channel_list
 
 
+def read_bin_and_gain(img_path: Path) -> Tuple[int, int]:
+    check_deadline("headers")
+    return get_bin_and_gain(extract_keyence_metadata(img_path))
+
+
 def get_bin_gain_from_embedded_meta(listing: dict) -> Tuple[List[int], List[int]]:
-    bin_list = []
-    gain_list = []
+    img_paths = []
     for cyc in listing:
         reg = list(listing[cyc].keys())[0]
         for ch in listing[cyc][reg]:
             # take only first zplane of the first tile to get bin and gain
             ti = list(listing[cyc][reg][ch].keys())[0]
             # values are paths to each zplane
-            img_path = list(listing[cyc][reg][ch][ti].values())[0]
+            img_paths.append(list(listing[cyc][reg][ch][ti].values())[0])
 
-            xml_data = extract_keyence_metadata(img_path)
-            binning, gain = get_bin_and_gain(xml_data)
-            bin_list.append(binning)
-            gain_list.append(gain)
+    # headers are read in parallel if the io config allows it for the device
+    start_stage("headers")
+    bin_gain_list = map_reads(read_bin_and_gain, img_paths)
+    bin_list = [binning for binning, _ in bin_gain_list]
+    gain_list = [gain for _, gain in bin_gain_list]
     return bin_list, gain_list
 
 
-def map_missing2(m2):
-    m2_data = m2.to_dict()[1]  # col 0 mapped to index, and col 1 contains the info
-    mapped_missing2_meta = {
-        "Version": m2_data["Version"],
-        "AcquisitionDate": m2_data["AcquisitionDate"],
-        "AssayType": m2_data["AssayType"],
-        "AssaySpecificSoftware": m2_data["AssaySpecificSoftware"],
-        "AcquisitionMode": m2_data["AcquisitionMode"],
-        "DatasetName": m2_data["DatasetName"],
-        "Microscope": m2_data["MicroscopeName"],
-    }
+def map_missing2(m2_data: Dict[str, Any]) -> Missing2Metadata:
+    mapped_missing2_meta = Missing2Metadata(
+        Version=m2_data["Version"],
+        AcquisitionDate=m2_data["AcquisitionDate"],
+        AssayType=m2_data["AssayType"],
+        AssaySpecificSoftware=m2_data["AssaySpecificSoftware"],
+        AcquisitionMode=m2_data["AcquisitionMode"],
+        DatasetName=m2_data["DatasetName"],
+        Microscope=m2_data["MicroscopeName"],
+    )
     return mapped_missing2_meta
 
 
-def check_listing_to_metadata_cor(listing: dict, exp_metadata: dict):
+def check_listing_to_metadata_cor(listing: dict, exp_metadata: ExperimentMetadata):
     msg_t = "Number of {smth} is different from the one specified in the metadata."
     cyc_t = msg_t.format(smth="cycles") + " Expected {exp}, got {got}."
     reg_t = msg_t.format(smth="regions in cycle {cyc}") + " Expected {exp}, got {got}."
@@ -514,101 +571,100 @@ def check_listing_to_metadata_cor(listing: dict, exp_metadata: dict):
         + " Expected {exp}, got {got}."
     )
 
-    assert len(listing.keys()) == exp_metadata["NumCycles"], cyc_t.format(
-        exp=exp_metadata["NumCycles"], got=len(listing.keys())
+    assert len(listing.keys()) == exp_metadata.NumCycles, cyc_t.format(
+        exp=exp_metadata.NumCycles, got=len(listing.keys())
     )
     for cyc in listing:
         regions = listing[cyc].keys()
-        assert len(regions) == exp_metadata["NumRegions"], reg_t.format(
-            cyc=cyc, exp=exp_metadata["NumRegions"], got=len(regions)
+        assert len(regions) == exp_metadata.NumRegions, reg_t.format(
+            cyc=cyc, exp=exp_metadata.NumRegions, got=len(regions)
         )
         for reg in regions:
             channels = listing[cyc][reg].keys()
-            assert len(channels) == exp_metadata["NumChannels"], ch_t.format(
-                cyc=cyc, reg=reg, exp=exp_metadata["NumChannels"], got=len(channels)
+            assert len(channels) == exp_metadata.NumChannels, ch_t.format(
+                cyc=cyc, reg=reg, exp=exp_metadata.NumChannels, got=len(channels)
             )
             for ch in channels:
                 tiles = listing[cyc][reg][ch].keys()
-                num_tiles = exp_metadata["RegionWidth"] * exp_metadata["RegionHeight"]
+                num_tiles = exp_metadata.RegionWidth * exp_metadata.RegionHeight
                 assert len(tiles) == num_tiles, ti_t.format(
                     cyc=cyc, reg=reg, ch=ch, exp=num_tiles, got=len(tiles)
                 )
                 for ti in tiles:
                     zplanes = listing[cyc][reg][ch][ti].keys()
-                    assert len(zplanes) == exp_metadata["NumZPlanes"], zp_t.format(
+                    assert len(zplanes) == exp_metadata.NumZPlanes, zp_t.format(
                         cyc=cyc,
                         reg=reg,
                         ch=ch,
                         ti=ti,
-                        exp=exp_metadata["NumZPlanes"],
+                        exp=exp_metadata.NumZPlanes,
                         got=len(zplanes),
                     )
 
 
-def convert_metadata(dataset_path: Path, out_path: Path):
-    if not dataset_path.exists():
-        msg = f"Specified input directory {dataset_path} does not exist"
-        raise FileNotFoundError(msg)
-    if not out_path.exists():
-        logger.info(f"Output directory {out_path} does not exist. Will create new.")
-        make_dir_if_not_exists(out_path)
-
-    experiment_json_name = get_experiment_json_name(dataset_path)
-    check_other_metadata_present(dataset_path)
-
-    exp_path = dataset_path / experiment_json_name
-    seg_path = dataset_path / "segmentation.json"
-    missing1_meta_path = dataset_path / "missing1.xlsx"
-    missing2_meta_path = dataset_path / "missing2.xlsx"
-    exposure_times_table_path = dataset_path / "exposure_times.txt"
-
+def collect_metadata(
+    inventory: "DatasetInventory",
+    exp_path: Path,
+    seg_path: Path,
+    missing1_meta_path: Path,
+    missing2_meta_path: Path,
+    exposure_times_table_path: Union[None, Path],
+    listing_future: Union[None, Future] = None,
+) -> Dict[str, Any]:
+    start_stage("metadata")
     exp_metadata = read_json(exp_path)
     seg_metadata = read_json(seg_path)
 
     logger.debug("Reading experiment data")
 
-    experiment_schema = get_experiment_metadata_schema(exp_metadata)
-    jsonschema.validate(exp_metadata, experiment_schema)
+    validate(exp_metadata, get_experiment_metadata_schema_name(exp_metadata))
     mapped_exp_meta = map_experiment_meta(exp_metadata)
     mapped_seg_meta = map_segmentation_meta(seg_metadata)
 
+    check_deadline("metadata")
     exposure_times_table = read_exposure_times_table(exposure_times_table_path)
     exposure_times = get_exposure_times(exp_metadata, exposure_times_table)
 
-    total_num_channels = mapped_exp_meta["NumCycles"] * mapped_exp_meta["NumChannels"]
-    num_channels_per_cycle = mapped_exp_meta["NumChannels"]
+    total_num_channels = mapped_exp_meta.NumCycles * mapped_exp_meta.NumChannels
+    num_channels_per_cycle = mapped_exp_meta.NumChannels
 
     logger.debug("Reading missing data")
-    m1 = read_missing1(missing1_meta_path, total_num_channels)
-    m2 = read_missing2(missing2_meta_path)
+    check_deadline("metadata")
+    with limit_file_read(missing1_meta_path):
+        m1 = cached_read(read_missing1, missing1_meta_path, total_num_channels)
+    check_deadline("metadata")
+    with limit_file_read(missing2_meta_path):
+        m2 = cached_read(read_missing2, missing2_meta_path)
     mapped_missing2_meta = map_missing2(m2)
 
     logger.debug("Reading data embedded in images")
-    img_dirs = get_img_dirs(dataset_path)
-    listing = create_listing_for_each_cycle_region(img_dirs)
+    if listing_future is not None:
+        listing = listing_future.result()
+    else:
+        listing = scan_image_dirs(inventory)
     check_listing_to_metadata_cor(listing, mapped_exp_meta)
     bin_list, gain_list = get_bin_gain_from_embedded_meta(listing)
 
     logger.debug("Populating ChannelDetails")
 
     nuclear_stain, membrane_stain = get_nuc_and_membr_markers(
-        m1, num_channels_per_cycle, mapped_seg_meta
+        m1, num_channels_per_cycle, mapped_seg_meta, missing1_meta_path.name
     )
 
     channel_list = create_channel_details(
         m1, bin_list, gain_list, exposure_times, num_channels_per_cycle
     )
     channel_metadata = {
-        "ChannelDetails": {"ChannelDetailsArray": [ch.__dict__ for ch in channel_list]}
+        "ChannelDetails": {"ChannelDetailsArray": records_to_dicts(channel_list)}
     }
 
     logger.debug("Combining collected metadata")
     metadata_dicts = (
-        mapped_missing2_meta,
-        mapped_exp_meta,
+        mapped_missing2_meta.to_dict(),
+        mapped_exp_meta.to_dict(),
         nuclear_stain,
         membrane_stain,
-        mapped_seg_meta,
+        mapped_seg_meta.to_dict(),
         channel_metadata,
     )
 
@@ -616,12 +672,61 @@ def convert_metadata(dataset_path: Path, out_path: Path):
     for dictionary in metadata_dicts:
         for k, v in dictionary.items():
             complete_metadata[k] = v
+    return complete_metadata
+
+
+def convert_metadata(dataset_path: Path, out_path: Path, overlap: bool = False):
+    from dataset_probe import probe_dataset
+
+    # all later steps take the files from the inventory
+    # instead of looking them up in the dataset directory again
+    start_stage("probe")
+    inventory = probe_dataset(dataset_path)
+    check_deadline("probe")
+    if not out_path.exists():
+        logger.info(f"Output directory {out_path} does not exist. Will create new.")
+        make_dir_if_not_exists(out_path)
+
+    exp_path = inventory.get_experiment_json_path()
+    sidecar_paths = inventory.get_sidecar_paths()
+
+    seg_path = sidecar_paths["segmentation"]
+    missing1_meta_path = sidecar_paths["missing1"]
+    missing2_meta_path = sidecar_paths["missing2"]
+    exposure_times_table_path = inventory.get_optional_path("exposure_times.txt")
+
+    # the image directory scan does not depend on the sidecar files,
+    # so in overlapped mode it runs in background while they are parsed
+    scan_executor = None
+    listing_future = None
+    if overlap:
+        scan_executor = ThreadPoolExecutor(max_workers=1)
+        listing_future = scan_executor.submit(scan_image_dirs, inventory)
+    try:
+        complete_metadata = collect_metadata(
+            inventory,
+            exp_path,
+            seg_path,
+            missing1_meta_path,
+            missing2_meta_path,
+            exposure_times_table_path,
+            listing_future,
+        )
+    except Exception:
+        if scan_executor is not None:
+            # the scan stops at its next directory instead of
+            # continuing into the conversion of the next dataset
+            cancel_dataset()
+            scan_executor.shutdown(wait=True)
+        raise
+    finally:
+        if scan_executor is not None:
+            scan_executor.shutdown(wait=False)
 
     logger.debug("Validating collected metadata")
-    jsonschema.validate(complete_metadata, dataset_schema)
+    validate(complete_metadata, "dataset")
     logger.debug("Writing final dataset.json")
-    with open(out_path / "dataset.json", "w", encoding="utf-8") as s:
-        json.dump(complete_metadata, s, indent=4, sort_keys=False)
+    write_json_file(out_path / "dataset.json", complete_metadata, indent=4)
     return
 
 
@@ -635,73 +740,933 @@ def read_input_excel(workdir) -> Dict[Path, Path]:
         )
         raise FileNotFoundError(msg)
 
-    input_map = pd.read_excel(input_path, header=0, usecols=[0, 1], dtype=str)
-    input_map = input_map.dropna(axis=0)
+    rows = read_xlsx_rows(input_path, max_cols=2)
+    absent_cols, columns = select_columns(rows, ["InputDir", "OutputDir"])
+    if absent_cols != []:
+        msg = f"These columns {str(absent_cols)} are absent in the input.xlsx"
+        raise ValueError(msg)
+    input_map = [
+        (cell_to_str(i), cell_to_str(o))
+        for i, o in zip(*columns)
+        if not is_missing(i) and not is_missing(o)
+    ]
 
-    inputs = str_list_to_paths(input_map["InputDir"].to_list())
-    outputs = str_list_to_paths(input_map["OutputDir"].to_list())
+    inputs = str_list_to_paths([i for i, o in input_map])
+    outputs = str_list_to_paths([o for i, o in input_map])
     input_output_map = {i: o for i, o in zip(inputs, outputs)}
     return input_output_map
 
 
-def main(workdir: Path):
-    input_output_map = read_input_excel(workdir)
-    collected_exceptions = []
-    logger.info("Started conversion")
+def read_inputs(
+    workdir: Path,
+    discover_roots: Union[None, List[Path]] = None,
+    output_template: Union[None, str] = None,
+) -> Dict[Path, Path]:
+    """Returns {input dir: output dir} of the datasets listed in input.xlsx,
+    or of the datasets found in discover_roots if they are provided
+    """
+    if not discover_roots:
+        return read_input_excel(workdir)
+    from dataset_discovery import discover_input_output_map
 
-    for input_dir, out_dir in input_output_map.items():
-        logger.info("Converting metadata in dataset " + str(input_dir))
-        try:
-            convert_metadata(input_dir, out_dir)
-            logger.info("Success")
-            logger.info("\n")
-        except Exception as e:
-            tr = traceback.format_exc()
-            collected_exceptions.append((input_dir, e, tr))
-            logger.info("Failed")
-            logger.info("\n")
+    def log_unreadable_dir(dir_path: Path, error: OSError):
+        logger.warning(f"Could not search for datasets in {dir_path}: {error}")
 
-    num_total = len(input_output_map.keys())
-    num_failed = len(collected_exceptions)
+    logger.info("Searching for datasets in " + ", ".join(map(str, discover_roots)))
+    input_output_map = discover_input_output_map(
+        discover_roots, output_template, on_error=log_unreadable_dir
+    )
+    logger.info(f"Found {len(input_output_map)} datasets")
+    return input_output_map
+
+
+def log_report(
+    num_total: int,
+    collected_exceptions: List[Tuple[Any, Any, str]],
+    num_skipped: int = 0,
+    num_in_progress: int = 0,
+    timed_out: Union[None, List[Tuple[Any, Any, str]]] = None,
+):
+    timed_out = [] if timed_out is None else timed_out
+    num_failed = len(collected_exceptions) + len(timed_out)
     logger.info("REPORT:")
-    if num_failed > 0:
+    if len(collected_exceptions) > 0:
         logger.info("Conversion failed for the following datasets, with errors:")
         for ex in collected_exceptions:
             logger.info("Dataset: " + str(ex[0]))
             logger.info("Error: " + str(ex[1]))
             logger.debug("Traceback: " + str(ex[2]))
             logger.info("\n")
+    if len(timed_out) > 0:
+        logger.info("Conversion timed out for the following datasets:")
+        for ex in timed_out:
+            logger.info("Dataset: " + str(ex[0]))
+            logger.info("Error: " + str(ex[1]))
+            logger.info("\n")
     logger.info(
         "Successfully converted datasets "
-        + str(num_total - num_failed)
+        + str(num_total - num_failed - num_in_progress)
         + "/"
         + str(num_total)
     )
-    logger.info("FINISHED")
-    _ = input("Press Enter to close")
+    if num_skipped > 0:
+        logger.info("Skipped previously converted datasets " + str(num_skipped))
+    if num_in_progress > 0:
+        logger.info(
+            "Datasets still being converted by other workers " + str(num_in_progress)
+        )
+
+
+def convert_dataset(
+    input_dir: Path, out_dir: Path, overlap: bool = False
+) -> Union[None, Tuple[str, str]]:
+    """Returns None on success or (error, traceback) on failure"""
+    start_dataset()
+    try:
+        convert_metadata(input_dir, out_dir, overlap)
+    except Exception as e:
+        return str(e), traceback.format_exc()
+    return None
+
+
+def time_conversion(
+    input_dir: Path, out_dir: Path, overlap: bool = False
+) -> Tuple[Union[None, Tuple[str, str]], float, bool]:
+    """Returns the result of convert_dataset, the seconds it took,
+    measured in the process that converted the dataset,
+    and whether it stopped at a deadline
+    """
+    start = time.perf_counter()
+    error = convert_dataset(input_dir, out_dir, overlap)
+    timed_out = error is not None and has_timed_out()
+    return error, time.perf_counter() - start, timed_out
+
+
+def convert_in_worker_process(
+    input_dir: Path, out_dir: Path, overlap: bool = False
+) -> tuple:
+    """Returns the result of time_conversion and the summaries
+    of the adaptive limits of the process, they are logged by the parent
+    """
+    return time_conversion(input_dir, out_dir, overlap) + (get_adaptive_summaries(),)
+
+
+def take_worker_result(
+    result: tuple,
+) -> Tuple[Union[None, Tuple[str, str]], float, bool]:
+    """Keeps the summaries of the result of convert_in_worker_process,
+    returns the result of time_conversion
+    """
+    add_reported_summaries(result[3])
+    return result[:3]
+
+
+def schedule_datasets(
+    input_output_map: Dict[Path, Path], schedule: str, jobs: Union[None, int] = None
+) -> Tuple[Dict[Path, Path], Dict[Path, Union[None, DatasetCost]]]:
+    """Orders the datasets by their estimated conversion time,
+    returns the ordered datasets and the estimates
+    """
+    logger.info(f"Estimating conversion time of {len(input_output_map)} datasets")
+    costs = estimate_costs(list(input_output_map.keys()))
+    num_unknown = sum(c is None for c in costs.values())
+    if num_unknown > 0:
+        logger.info(
+            f"Could not estimate {num_unknown} datasets, they are scheduled as the shortest"
+        )
+    ordered_map = order_datasets(input_output_map, costs, schedule)
+    msg = f"Datasets are converted {schedule}"
+    if jobs is not None:
+        input_order = [get_seconds(costs[i]) for i in input_output_map.keys()]
+        scheduled = [get_seconds(costs[i]) for i in ordered_map.keys()]
+        msg += (
+            f", estimated time {format_duration(estimate_makespan(scheduled, jobs))}"
+            + f", in the input order {format_duration(estimate_makespan(input_order, jobs))}"
+        )
+    logger.info(msg)
+    return ordered_map, costs
+
+
+def log_estimates(
+    costs: Dict[Path, Union[None, DatasetCost]], seconds: Dict[Path, float]
+):
+    """Compares estimated and actual conversion times of the datasets"""
+    pairs = []
+    for input_dir, actual in seconds.items():
+        cost = costs.get(input_dir)
+        if cost is not None:
+            pairs.append((cost.seconds, actual))
+            logger.debug(
+                f"Dataset {str(input_dir)} estimated {cost.seconds:.2f}s"
+                + f", converted in {actual:.2f}s"
+            )
+    if pairs == []:
+        return
+    ratios = sorted(actual / estimated for estimated, actual in pairs)
+    logger.info(
+        f"Estimated conversion time of the datasets {sum(p[0] for p in pairs):.1f}s"
+        + f", actual {sum(p[1] for p in pairs):.1f}s"
+        + f", median actual/estimated {ratios[len(ratios) // 2]:.2f}"
+        + f", range {ratios[0]:.2f}-{ratios[-1]:.2f}"
+    )
+
+
+def open_catalogs(workdir: Path, catalog: bool = False, marker_index: bool = False):
+    """Returns [(upsert function, connection)] of the enabled catalogs"""
+    catalogs = []
+    if catalog:
+        import catalog as dataset_catalog
+
+        catalog_path = dataset_catalog.get_catalog_path(workdir)
+        logger.info(f"Converted datasets are added to the catalog {str(catalog_path)}")
+        conn = dataset_catalog.open_catalog(catalog_path)
+        catalogs.append((dataset_catalog.upsert_dataset, conn))
+    if marker_index:
+        import marker_index as markers
+
+        index_path = markers.get_marker_index_path(workdir)
+        logger.info(f"Markers of converted datasets are indexed in {str(index_path)}")
+        conn = markers.open_marker_index(index_path)
+        catalogs.append((markers.upsert_dataset, conn))
+    return catalogs
+
+
+def add_to_catalogs(catalogs: List[Tuple[Any, Any]], input_dir: Path, out_dir: Path):
+    """The dataset stays converted if it could not be added to the catalogs"""
+    if catalogs == []:
+        return
+    try:
+        metadata = read_json_file(out_dir / "dataset.json")
+        for upsert_dataset, conn in catalogs:
+            upsert_dataset(conn, input_dir, out_dir, metadata)
+    except Exception as e:
+        logger.warning(f"Could not add dataset {str(input_dir)} to the catalog: {e}")
+
+
+def close_catalogs(catalogs: List[Tuple[Any, Any]]):
+    for _, conn in catalogs:
+        conn.close()
+
+
+class ConversionOptions(NamedTuple):
+    """Options of the conversion given on the command line"""
+
+    overlap: bool = False
+    resume: bool = False
+    distributed: bool = False
+    requeue: bool = False
+    jobs: int = 1
+    shared_cache: bool = False
+    discover_roots: Union[None, List[Path]] = None
+    output_template: Union[None, str] = None
+    catalog: bool = False
+    marker_index: bool = False
+    schedule: str = "input"
+    io_config_path: Union[None, Path] = None
+    max_read_mb_per_s: Union[None, float] = None
+    max_iops: Union[None, float] = None
+    low_io_priority: bool = False
+    dataset_timeout: Union[None, float] = None
+    stage_timeout: Union[None, float] = None
+
+
+def init_conversion_process(
+    max_cache_entries: int,
+    shared_cache_dir: Union[None, Path],
+    shared_counters,
+    io_config: Union[None, IOConfig] = None,
+    io_throttles=None,
+    rate_limiter: Union[None, RateLimiter] = None,
+    low_io_priority: bool = False,
+    dataset_timeout: Union[None, float] = None,
+    stage_timeout: Union[None, float] = None,
+):
+    configure_cache(max_cache_entries, shared_cache_dir)
+    configure_counters(shared_counters)
+    detach_reporter()
+    configure_io_limits(io_config, io_throttles, rate_limiter)
+    configure_deadlines(dataset_timeout, stage_timeout)
+    if low_io_priority:
+        lower_io_priority()
+
+
+def get_initargs(
+    options: ConversionOptions,
+    shared_cache_dir: Union[None, Path],
+    shared_counters,
+    io_config: Union[None, IOConfig],
+    io_throttles: Union[None, Dict[int, DeviceThrottle]],
+    rate_limiter: Union[None, RateLimiter],
+) -> tuple:
+    """Arguments of init_conversion_process in the worker processes"""
+    return (
+        MAX_CACHE_ENTRIES,
+        shared_cache_dir,
+        shared_counters,
+        io_config,
+        io_throttles,
+        rate_limiter,
+        options.low_io_priority,
+        options.dataset_timeout,
+        options.stage_timeout,
+    )
+
+
+def apply_low_io_priority():
+    applied = lower_io_priority()
+    if applied != []:
+        logger.info("Lowered priority of the conversion: " + ", ".join(applied))
+    else:
+        logger.warning("Could not lower priority of the conversion")
+
+
+def log_rate_limits(rate_limiter: Union[None, RateLimiter]):
+    if rate_limiter is None:
+        return
+    limits = []
+    if rate_limiter.max_mb_per_s > 0:
+        limits.append(f"{rate_limiter.max_mb_per_s:g} MB/s")
+    if rate_limiter.max_iops > 0:
+        limits.append(f"{rate_limiter.max_iops:g} operations/s")
+    logger.info("Reads are limited to " + " and ".join(limits))
+
+
+def log_io_throttling(rate_limiter: Union[None, RateLimiter]):
+    """Logs the reads and how much they were delayed by the rate limits"""
+    if rate_limiter is None:
+        return
+    summary = rate_limiter.get_summary()
+    logger.info(
+        f"Read {format_bytes(summary['bytes'])} in {summary['operations']} operations"
+        + f", on average {format_bytes(summary['bytes_per_s'])}/s"
+        + f" and {summary['iops']:.1f} operations/s"
+    )
+    logger.info(
+        f"Rate limits delayed {summary['delayed']} reads, summed over the reads by"
+        + f" {summary['bandwidth_wait']:.1f}s for the bandwidth"
+        + f" and {summary['operations_wait']:.1f}s for the operations"
+    )
+
+
+def configure_read_limits(
+    options: ConversionOptions,
+) -> Tuple[Union[None, IOConfig], Union[None, RateLimiter]]:
+    """Limits the reads of this process, it is called before anything is read"""
+    io_config = None
+    if options.io_config_path is not None:
+        io_config = load_io_config(options.io_config_path)
+    rate_limiter = create_rate_limiter(options.max_read_mb_per_s, options.max_iops)
+    if options.low_io_priority:
+        apply_low_io_priority()
+    log_rate_limits(rate_limiter)
+    configure_io_limits(io_config, rate_limiter=rate_limiter)
+    return io_config, rate_limiter
+
+
+def configure_batch_io_limits(
+    input_dirs: List[Path],
+    io_config: Union[None, IOConfig],
+    rate_limiter: Union[None, RateLimiter] = None,
+) -> Tuple[Dict[Path, Union[None, int]], Dict[int, DeviceThrottle]]:
+    """Creates limits of the devices of the datasets, they are shared
+    with the worker processes. Returns {input dir: device} and {device: limits}
+    """
+    if io_config is None:
+        configure_io_limits(rate_limiter=rate_limiter)
+        return dict(), dict()
+    devices = get_devices(input_dirs)
+    known_devices = [d for d in devices.values() if d is not None]
+    throttles = create_throttles(io_config, known_devices)
+    for device in sorted(throttles):
+        limits = get_mount_limits(io_config, device)
+        num_datasets = sum(d == device for d in devices.values())
+        logger.info(
+            f"Limits of {num_datasets} datasets on device {device} ({limits.name}): "
+            + format_limits(limits)
+        )
+    configure_io_limits(io_config, throttles, rate_limiter)
+    return devices, throttles
+
+
+def log_adaptive_concurrency():
+    """Logs the concurrency of the reads found for each device with adaptive limits,
+    in this process and in the worker processes
+    """
+    summaries = get_reported_summaries()
+    # throttles shared with the workers are up to date in this process
+    summaries.update(get_adaptive_summaries())
+    for device, summary in sorted(summaries.items()):
+        logger.info(
+            f"Concurrent reads on device {device} ({summary['name']}): "
+            + f"{summary['limit']}, adjusted {summary['adjustments']} times"
+            + f" between {summary['lowest']} and {summary['highest']}"
+            + f", lowest latency {summary['min_latency'] * 1000:.1f} ms"
+        )
+
+
+def log_finished_dataset(
+    input_dir: Path, error: Union[None, Tuple[str, str]], timed_out: bool
+):
+    # datasets of parallel processes finish in any order,
+    # so the outcome is logged with the name of the dataset
+    if error is None:
+        logger.info("Converted metadata in dataset " + str(input_dir))
+    elif timed_out:
+        logger.info("Conversion timed out in dataset " + str(input_dir))
+    else:
+        logger.info("Conversion failed in dataset " + str(input_dir))
+
+
+def get_supervised_result(
+    outcome: str, result: Any, seconds: float
+) -> Tuple[Union[None, Tuple[str, str]], float, bool]:
+    """Converts the outcome of a task of the supervised pool
+    to the result of time_conversion, the task is convert_in_worker_process
+    """
+    from supervised_pool import DONE, ERROR, KILLED
+
+    if outcome == DONE:
+        return take_worker_result(result)
+    if outcome == KILLED:
+        return (result, ""), seconds, True
+    if outcome == ERROR:
+        return (result.strip().splitlines()[-1], result), seconds, False
+    return (result, ""), seconds, False
+
+
+def run_supervised_conversions(
+    input_output_map: Dict[Path, Path],
+    options: ConversionOptions,
+    initargs: tuple,
+    io_config: Union[None, IOConfig] = None,
+    devices: Union[None, Dict[Path, Union[None, int]]] = None,
+) -> Iterator[Tuple[Path, Path, Union[None, Tuple[str, str]], float, bool]]:
+    """Converts the datasets in worker processes that are killed
+    and replaced when a dataset does not stop at its timeout
+    """
+    from supervised_pool import KILLED, SupervisedPool
+
+    jobs, dataset_timeout = options.jobs, options.dataset_timeout
+    logger.info(
+        f"Converting datasets in {max(jobs, 1)} worker processes"
+        + f" with the timeout of {dataset_timeout:g} seconds per dataset"
+    )
+    dispatcher = DatasetDispatcher(list(input_output_map.keys()), devices, io_config)
+    with SupervisedPool(
+        jobs, dataset_timeout + KILL_GRACE, init_conversion_process, initargs
+    ) as pool:
+        while len(dispatcher) > 0 or pool.num_running() > 0:
+            while pool.num_idle() > 0:
+                input_dir = dispatcher.next_dataset()
+                if input_dir is None:
+                    break
+                logger.info("Converting metadata in dataset " + str(input_dir))
+                out_dir = input_output_map[input_dir]
+                pool.submit(
+                    input_dir,
+                    convert_in_worker_process,
+                    input_dir,
+                    out_dir,
+                    options.overlap,
+                )
+            for input_dir, outcome, result, seconds in pool.wait():
+                dispatcher.dataset_done(input_dir)
+                if outcome == KILLED:
+                    logger.warning(
+                        f"Restarted the worker process of dataset {str(input_dir)}"
+                        + " that did not stop at the timeout"
+                    )
+                out_dir = input_output_map[input_dir]
+                result = get_supervised_result(outcome, result, seconds)
+                log_finished_dataset(input_dir, result[0], result[2])
+                yield (input_dir, out_dir) + result
+
+
+def run_conversions(
+    input_output_map: Dict[Path, Path],
+    options: ConversionOptions,
+    initargs: tuple,
+    io_config: Union[None, IOConfig] = None,
+    devices: Union[None, Dict[Path, Union[None, int]]] = None,
+) -> Iterator[Tuple[Path, Path, Union[None, Tuple[str, str]], float, bool]]:
+    """Yields (input dir, output dir, result of convert_dataset, seconds, timed out)
+    in the order of completion. The datasets are started in the order of the map.
+    """
+    if options.dataset_timeout is not None:
+        # a read that hangs cannot be cancelled, so the datasets
+        # are converted in processes that can be killed
+        yield from run_supervised_conversions(
+            input_output_map, options, initargs, io_config, devices
+        )
+        return
+    overlap, jobs = options.overlap, options.jobs
+    if jobs <= 1:
+        for input_dir, out_dir in input_output_map.items():
+            logger.info("Converting metadata in dataset " + str(input_dir))
+            yield (input_dir, out_dir) + time_conversion(input_dir, out_dir, overlap)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    logger.info(f"Converting datasets in {jobs} parallel processes")
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=init_conversion_process, initargs=initargs
+    ) as executor:
+        # datasets are submitted one at a time, when a process is free
+        # and the device of the dataset is below its max_datasets
+        dispatcher = DatasetDispatcher(
+            list(input_output_map.keys()), devices, io_config
+        )
+        running = dict()
+        while len(dispatcher) > 0 or running:
+            while len(running) < jobs:
+                input_dir = dispatcher.next_dataset()
+                if input_dir is None:
+                    break
+                logger.info("Converting metadata in dataset " + str(input_dir))
+                out_dir = input_output_map[input_dir]
+                future = executor.submit(
+                    convert_in_worker_process, input_dir, out_dir, overlap
+                )
+                running[future] = (input_dir, out_dir)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                input_dir, out_dir = running.pop(future)
+                dispatcher.dataset_done(input_dir)
+                result = take_worker_result(future.result())
+                log_finished_dataset(input_dir, result[0], result[2])
+                yield (input_dir, out_dir) + result
+
+
+def run_batch(workdir: Path, options: ConversionOptions):
+    # reads of the search for the datasets and of their probes are limited too
+    io_config, rate_limiter = configure_read_limits(options)
+    input_output_map = read_inputs(
+        workdir, options.discover_roots, options.output_template
+    )
+    journal_path = get_journal_path(workdir)
+    num_skipped = 0
+    if options.resume:
+        completed = get_completed_datasets(journal_path)
+        num_skipped = sum(str(i) in completed for i in input_output_map.keys())
+        input_output_map = {
+            i: o for i, o in input_output_map.items() if str(i) not in completed
+        }
+        logger.info(
+            f"Resuming conversion. Skipping {num_skipped} datasets"
+            + " that were converted in previous runs"
+        )
+    costs = dict()
+    if options.schedule != "input":
+        input_output_map, costs = schedule_datasets(
+            input_output_map, options.schedule, options.jobs
+        )
+    shared_cache_dir = get_shared_cache_dir(workdir) if options.shared_cache else None
+    configure_cache(MAX_CACHE_ENTRIES, shared_cache_dir)
+    configure_deadlines(options.dataset_timeout, options.stage_timeout)
+    record_batch_start(journal_path, options.resume)
+    collected_exceptions = []
+    timed_out_datasets = []
+    conversion_seconds = dict()
+    logger.info("Started conversion")
+
+    # progress counters of the worker processes are summed in shared memory
+    in_processes = options.jobs > 1 or options.dataset_timeout is not None
+    shared_counters = create_shared_counters() if in_processes else None
+    configure_counters(shared_counters)
+    devices, io_throttles = configure_batch_io_limits(
+        list(input_output_map.keys()), io_config, rate_limiter
+    )
+    initargs = get_initargs(
+        options,
+        shared_cache_dir,
+        shared_counters,
+        io_config,
+        io_throttles,
+        rate_limiter,
+    )
+    catalogs = open_catalogs(workdir, options.catalog, options.marker_index)
+    progress = ProgressReporter(len(input_output_map), logger.info)
+    progress.start()
+    try:
+        conversions = run_conversions(
+            input_output_map, options, initargs, io_config, devices
+        )
+        for input_dir, out_dir, error, seconds, timed_out in conversions:
+            progress.dataset_done()
+            conversion_seconds[input_dir] = seconds
+            cost = costs.get(input_dir)
+            estimated_seconds = None if cost is None else cost.seconds
+            timing = dict(seconds=seconds, estimated_seconds=estimated_seconds)
+            if error is None:
+                record_outcome(journal_path, input_dir, out_dir, "success", **timing)
+                add_to_catalogs(catalogs, input_dir, out_dir)
+                logger.info("Success")
+                logger.info("\n")
+            elif timed_out:
+                timed_out_datasets.append((input_dir, error[0], error[1]))
+                record_outcome(
+                    journal_path, input_dir, out_dir, "timed_out", error[0], **timing
+                )
+                logger.info("Timed out")
+                logger.info("\n")
+            else:
+                collected_exceptions.append((input_dir, error[0], error[1]))
+                record_outcome(
+                    journal_path, input_dir, out_dir, "failed", error[0], **timing
+                )
+                logger.info("Failed")
+                logger.info("\n")
+    finally:
+        progress.stop()
+        close_catalogs(catalogs)
+
+    log_estimates(costs, conversion_seconds)
+    log_adaptive_concurrency()
+    log_io_throttling(rate_limiter)
+    num_total = len(input_output_map.keys())
+    log_report(
+        num_total, collected_exceptions, num_skipped, timed_out=timed_out_datasets
+    )
+
+
+def run_worker(workdir: Path, options: ConversionOptions):
+    queue_dir = get_queue_dir(workdir)
+    worker_id = get_worker_id()
+    overlap, dataset_timeout = options.overlap, options.dataset_timeout
+    if options.requeue:
+        num_requeued = requeue_claimed_tasks(queue_dir)
+        logger.info(f"Returned {num_requeued} interrupted datasets to the queue")
+        return
+    # limits apply to this worker, other workers have their own
+    io_config, rate_limiter = configure_read_limits(options)
+    if not (queue_dir / "pending").exists():
+        input_output_map = read_inputs(
+            workdir, options.discover_roots, options.output_template
+        )
+        if options.schedule != "input":
+            # workers claim the datasets in the order of the queue
+            input_output_map, _ = schedule_datasets(input_output_map, options.schedule)
+        if init_queue(queue_dir, input_output_map):
+            logger.info(f"Created work queue {str(queue_dir)}")
+    shared_cache_dir = get_shared_cache_dir(workdir) if options.shared_cache else None
+    if shared_cache_dir is not None:
+        configure_cache(MAX_CACHE_ENTRIES, shared_cache_dir)
+    configure_deadlines(dataset_timeout, options.stage_timeout)
+    logger.info(f"Started conversion as worker {worker_id}")
+
+    pool = None
+    if dataset_timeout is not None:
+        from supervised_pool import SupervisedPool
+
+        # the dataset is converted in a child process that is killed when it hangs
+        shared_counters = create_shared_counters()
+        configure_counters(shared_counters)
+        initargs = get_initargs(
+            options, shared_cache_dir, shared_counters, io_config, None, rate_limiter
+        )
+        pool = SupervisedPool(
+            1, dataset_timeout + KILL_GRACE, init_conversion_process, initargs
+        )
+
+    # datasets are shared with other workers, so their total is not known
+    progress = ProgressReporter(None, logger.info)
+    progress.start()
+    try:
+        while True:
+            task = claim_task(queue_dir, worker_id)
+            if task is None:
+                break
+            task_name, input_dir, out_dir = task
+            logger.info("Converting metadata in dataset " + str(input_dir))
+            if pool is None:
+                error, _, timed_out = time_conversion(input_dir, out_dir, overlap)
+            else:
+                pool.submit(
+                    input_dir, convert_in_worker_process, input_dir, out_dir, overlap
+                )
+                _, outcome, result, seconds = pool.wait()[0]
+                error, _, timed_out = get_supervised_result(outcome, result, seconds)
+            progress.dataset_done()
+            if error is None:
+                complete_task(
+                    queue_dir, worker_id, task_name, input_dir, out_dir, "success"
+                )
+                logger.info("Success")
+                logger.info("\n")
+            else:
+                complete_task(
+                    queue_dir,
+                    worker_id,
+                    task_name,
+                    input_dir,
+                    out_dir,
+                    "timed_out" if timed_out else "failed",
+                    *error,
+                )
+                logger.info("Timed out" if timed_out else "Failed")
+                logger.info("\n")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        progress.stop()
+
+    log_adaptive_concurrency()
+    log_io_throttling(rate_limiter)
+    # the report includes datasets converted by all workers
+    task_counts = count_tasks(queue_dir)
+    num_total = sum(task_counts.values())
+    outcomes = merge_reports(queue_dir)
+    log_report(
+        num_total,
+        get_failed_tasks(outcomes),
+        num_in_progress=task_counts["claimed"],
+        timed_out=get_failed_tasks(outcomes, "timed_out"),
+    )
+
+
+def run_validation(
+    paths: List[Path],
+    file_list: Union[None, Path],
+    report_path: Path,
+    jobs: int = 1,
+) -> bool:
+    """Validates existing dataset.json and experiment.json files,
+    writes a report line per document and returns True if all are valid.
+    Returns False if no documents were found.
+    """
+    from bulk_validation import (
+        find_documents,
+        iter_validation_results,
+        read_file_list,
+        write_report_entry,
+    )
+
+    if file_list is not None:
+        paths = paths + read_file_list(file_list)
+    if jobs > 1:
+        logger.info(f"Validating documents in {jobs} parallel processes")
+    num_total = 0
+    num_invalid = 0
+    with open(report_path, "w", encoding="utf-8") as report_stream:
+        for entry in iter_validation_results(find_documents(paths), jobs):
+            write_report_entry(report_stream, entry)
+            num_total += 1
+            if not entry["valid"]:
+                num_invalid += 1
+                first_error = entry["errors"][0]
+                logger.info(
+                    f"Invalid document {entry['document']}, "
+                    + f"{len(entry['errors'])} errors, first at "
+                    + f"'{first_error['path']}': {first_error['message']}"
+                )
+
+    if num_total == 0:
+        # most likely a mistyped path, not a clean run
+        logger.error(
+            "No dataset.json or experiment.json files were found in "
+            + str([str(p) for p in paths])
+        )
+        return False
+    logger.info("REPORT:")
+    logger.info(f"Valid documents {num_total - num_invalid}/{num_total}")
+    logger.info("Report with all errors is written to " + str(report_path))
+    return num_invalid == 0
+
+
+def main(workdir: Path, options: ConversionOptions):
+    if options.distributed:
+        run_worker(workdir, options)
+        logger.info("FINISHED")
+    else:
+        run_batch(workdir, options)
+        logger.info("FINISHED")
+        _ = input("Press Enter to close")
 
 
 if __name__ == "__main__":
+    import multiprocessing
+
+    # child processes of the frozen executable start it again, this makes
+    # them run their task instead of the converter
+    multiprocessing.freeze_support()
     parser = argparse.ArgumentParser()
     parser.add_argument("--workdir", type=Path, help="dir where input.xlsx is stored")
+    parser.add_argument(
+        "--overlap",
+        action="store_true",
+        help="scan image directories while the metadata files are being read",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip datasets that were successfully converted in previous runs",
+    )
+    parser.add_argument(
+        "--distributed",
+        action="store_true",
+        help="run as one of several workers sharing the work queue in the workdir",
+    )
+    parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help="with --distributed, return datasets of interrupted workers to the queue",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of datasets converted in parallel processes",
+    )
+    parser.add_argument(
+        "--shared-cache",
+        action="store_true",
+        help="share parsed missing1 and missing2 files between parallel workers",
+    )
+    parser.add_argument(
+        "--discover",
+        type=Path,
+        nargs="+",
+        metavar="ROOT",
+        help="convert datasets found in these directories instead of input.xlsx",
+    )
+    parser.add_argument(
+        "--output-template",
+        help="with --discover, output dir of each dataset, e.g. /out/{relpath}."
+        + " Fields: {root}, {relpath}, {name}, {parent}",
+    )
+    parser.add_argument(
+        "--catalog",
+        action="store_true",
+        help="add converted datasets and their channels to catalog.sqlite in the workdir",
+    )
+    parser.add_argument(
+        "--marker-index",
+        action="store_true",
+        help="index markers and fluorophores of converted datasets"
+        + " in marker_index.sqlite in the workdir",
+    )
+    parser.add_argument(
+        "--schedule",
+        choices=SCHEDULES,
+        default="input",
+        help="order of conversion by estimated time of the datasets: largest-first"
+        + " to finish a parallel batch sooner, smallest-first to get results early",
+    )
+    parser.add_argument(
+        "--io-config",
+        type=Path,
+        help="TOML file with limits of concurrent datasets, header reads"
+        + " and bandwidth of each mount",
+    )
+    parser.add_argument(
+        "--max-read-mb-per-s",
+        type=float,
+        help="limit of the bandwidth of all reads, e.g. to convert"
+        + " on the acquisition computer while it is writing images",
+    )
+    parser.add_argument(
+        "--max-iops", type=float, help="limit of the read operations per second"
+    )
+    parser.add_argument(
+        "--low-io-priority",
+        action="store_true",
+        help="lower the CPU and I/O priority of the conversion",
+    )
+    parser.add_argument(
+        "--dataset-timeout",
+        type=float,
+        help="seconds after which the conversion of a dataset is stopped,"
+        + f" a worker process that hangs is killed {KILL_GRACE:g} seconds later",
+    )
+    parser.add_argument(
+        "--stage-timeout",
+        type=float,
+        help="seconds after which each stage of a dataset (probe, metadata,"
+        + " listing, headers) is stopped",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    validate_parser = subparsers.add_parser(
+        "validate",
+        help="validate existing dataset.json and experiment.json files",
+    )
+    validate_parser.add_argument(
+        "paths",
+        type=Path,
+        nargs="*",
+        help="files, or directories searched for dataset.json and experiment.json",
+    )
+    validate_parser.add_argument(
+        "--file-list", type=Path, help="text file with one path to validate per line"
+    )
+    validate_parser.add_argument(
+        "--report",
+        type=Path,
+        default=Path("validation_report.jsonl"),
+        help="where to write the report with all errors of each document",
+    )
+    validate_parser.add_argument(
+        "--jobs",
+        dest="validate_jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="number of parallel validation processes",
+    )
     args = parser.parse_args()
+    if args.discover and args.output_template is None:
+        parser.error("--discover requires --output-template")
+    if args.distributed and args.catalog:
+        parser.error("--catalog cannot be used with --distributed")
+    if args.distributed and args.marker_index:
+        parser.error("--marker-index cannot be used with --distributed")
+    if args.command == "validate" and args.jobs != 1:
+        parser.error("--jobs of validate is given after validate")
 
-    logger = logging.getLogger(__name__)
     logger.setLevel(logging.DEBUG)
-    c_handler = logging.StreamHandler()
-    f_handler = logging.FileHandler(args.workdir / "log.log")
-    c_handler.setLevel(logging.INFO)
-    f_handler.setLevel(logging.DEBUG)
     log_format = "%(asctime)s - %(levelname)s: %(message)s"
     datefmt = "%H:%M:%S"
+    c_handler = ProgressStreamHandler()
+    c_handler.setLevel(logging.INFO)
     c_format = logging.Formatter(log_format, datefmt=datefmt)
-    f_format = logging.Formatter(log_format, datefmt=datefmt)
     c_handler.setFormatter(c_format)
-    f_handler.setFormatter(f_format)
     logger.addHandler(c_handler)
+
+    if args.command == "validate":
+        all_valid = run_validation(
+            args.paths, args.file_list, args.report, args.validate_jobs
+        )
+        sys.exit(0 if all_valid else 1)
+
+    if args.distributed:
+        log_name = "log_" + get_worker_id() + ".log"
+    else:
+        log_name = "log.log"
+    f_handler = logging.FileHandler(args.workdir / log_name)
+    f_handler.setLevel(logging.DEBUG)
+    f_format = logging.Formatter(log_format, datefmt=datefmt)
+    f_handler.setFormatter(f_format)
     logger.addHandler(f_handler)
 
     logger.info("\n")
     logger.info("STARTED")
 
-    main(args.workdir)
+    options = ConversionOptions(
+        overlap=args.overlap,
+        resume=args.resume,
+        distributed=args.distributed,
+        requeue=args.requeue,
+        jobs=args.jobs,
+        shared_cache=args.shared_cache,
+        discover_roots=args.discover,
+        output_template=args.output_template,
+        catalog=args.catalog,
+        marker_index=args.marker_index,
+        schedule=args.schedule,
+        io_config_path=args.io_config,
+        max_read_mb_per_s=args.max_read_mb_per_s,
+        max_iops=args.max_iops,
+        low_io_priority=args.low_io_priority,
+        dataset_timeout=args.dataset_timeout,
+        stage_timeout=args.stage_timeout,
+    )
+    main(args.workdir, options)
@@ -0,0 +1,93 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+from dataset_probe import match_experiment_json
+from io_limits import limit_read
+
+DISCOVERY_THREADS = 16
+
+
+def scan_dir(dir_path: Path) -> Tuple[bool, List[Path]]:
+    """Returns (True, []) if the directory is a dataset,
+    otherwise (False, subdirectories)
+    """
+    with limit_read(None), os.scandir(dir_path) as it:
+        entries = list(it)
+    if match_experiment_json(e.name for e in entries) != []:
+        return True, []
+    # symlinks are not followed, they can make cycles
+    subdirs = [Path(e.path) for e in entries if e.is_dir(follow_symlinks=False)]
+    return False, sorted(subdirs)
+
+
+def discover_datasets(
+    roots: List[Path],
+    num_threads: int = DISCOVERY_THREADS,
+    on_error: Union[None, Callable[[Path, OSError], None]] = None,
+) -> Iterator[Tuple[Path, Path]]:
+    """Yields (root, dataset dir) of the directories with experiment.json
+    found under the roots, the datasets are not searched for subdirectories.
+    Directories are scanned in parallel threads, depth first, so only
+    the subdirectories of the directories on the current path are kept in memory.
+    Directories that cannot be read are passed to on_error and skipped.
+    """
+    pending = [(root, root) for root in reversed(roots)]
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        running = dict()
+        while pending or running:
+            while pending and len(running) < num_threads * 2:
+                root, dir_path = pending.pop()
+                running[executor.submit(scan_dir, dir_path)] = (root, dir_path)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                root, dir_path = running.pop(future)
+                try:
+                    is_dataset, subdirs = future.result()
+                except OSError as e:
+                    if on_error is not None:
+                        on_error(dir_path, e)
+                    continue
+                if is_dataset:
+                    yield root, dir_path
+                else:
+                    pending.extend((root, d) for d in reversed(subdirs))
+
+
+def get_output_dir(output_template: str, root: Path, dataset_dir: Path) -> Path:
+    """Fields of the template:
+    {root} - the root the dataset was found in,
+    {relpath} - path of the dataset relative to the root,
+    {name} - name of the dataset directory,
+    {parent} - name of the parent directory of the dataset
+    """
+    output_dir = output_template.format(
+        root=root,
+        relpath=dataset_dir.relative_to(root).as_posix(),
+        name=dataset_dir.name,
+        parent=dataset_dir.parent.name,
+    )
+    return Path(output_dir)
+
+
+def discover_input_output_map(
+    roots: List[Path],
+    output_template: str,
+    num_threads: int = DISCOVERY_THREADS,
+    on_error: Union[None, Callable[[Path, OSError], None]] = None,
+) -> Dict[Path, Path]:
+    """Returns {dataset dir: output dir} in the same form as read_input_excel"""
+    input_output_map = dict()
+    outputs = dict()
+    for root, dataset_dir in discover_datasets(roots, num_threads, on_error):
+        output_dir = get_output_dir(output_template, root, dataset_dir)
+        if output_dir in outputs and outputs[output_dir] != dataset_dir:
+            msg = (
+                f"Datasets {outputs[output_dir]} and {dataset_dir} have the same "
+                + f"output directory {output_dir}. Use {{relpath}} in the output template"
+            )
+            raise ValueError(msg)
+        outputs[output_dir] = dataset_dir
+        input_output_map[dataset_dir] = output_dir
+    return dict(sorted(input_output_map.items()))
@@ -1,8 +1,13 @@
 import re
+from functools import partial
 from os import walk
 from pathlib import Path
 from typing import Dict, List, Tuple, Union
 
+from deadlines import check_deadline
+from io_limits import get_limited_device, limit_read, map_reads
+from progress import add_progress
+
 
 def path_to_str(path: Path):
     return str(path.absolute().as_posix())
@@ -67,9 +72,13 @@ def arrange_listing_by_channel_tile_zplane(
 
 
 def get_image_paths_arranged_in_dict(
-    img_dir: Path,
+    img_dir: Path, device: Union[None, int] = None
 ) -> Dict[int, Dict[int, Dict[int, Path]]]:
-    img_listing = get_img_listing(img_dir)
+    check_deadline("listing")
+    with limit_read(device):
+        img_listing = get_img_listing(img_dir)
+    add_progress("dirs")
+    add_progress("files", len(img_listing))
     arranged_listing = arrange_listing_by_channel_tile_zplane(img_listing)
     return arranged_listing
 
@@ -123,11 +132,19 @@ def create_listing_for_each_cycle_region(
     cycle_region_dict = arrange_dirs_by_cycle_region(
         img_dirs, cycle_prefix, region_prefix
     )
-    for cycle, regions in cycle_region_dict.items():
-        listing_per_cycle[cycle] = dict()
-        for region, dir_path in regions.items():
-            arranged_listing = get_image_paths_arranged_in_dict(dir_path)
-            listing_per_cycle[cycle][region] = arranged_listing
+    cycle_regions = [
+        (cycle, region)
+        for cycle, regions in cycle_region_dict.items()
+        for region in regions
+    ]
+    dir_paths = [cycle_region_dict[cycle][region] for cycle, region in cycle_regions]
+    # directories are listed in parallel if the io config allows it for the device
+    device = get_limited_device(dir_paths[0])
+    arranged_listings = map_reads(
+        partial(get_image_paths_arranged_in_dict, device=device), dir_paths, device
+    )
+    for (cycle, region), arranged_listing in zip(cycle_regions, arranged_listings):
+        listing_per_cycle.setdefault(cycle, dict())[region] = arranged_listing
     sorted_listing = sort_dict(listing_per_cycle)
     return sorted_listing
 
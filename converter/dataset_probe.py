@@ -0,0 +1,112 @@
+import os
+import re
+from dataclasses import dataclass
+from fnmatch import filter as fnmatch_filter
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Union
+
+from dataset_listing import alpha_num_order
+from io_limits import limit_read
+
+EXPERIMENT_JSON_VARIANTS = (r"experiment\.json", r"Experiment\.json")
+SIDECAR_VARIANTS = {
+    "segmentation": ("segmentation.json",),
+    "missing1": ("missing1.xlsx", "missing1.csv", "missing1.tsv", "missing1.json"),
+    "missing2": ("missing2.xlsx", "missing2.csv", "missing2.json"),
+}
+IMG_DIR_PATTERN = "?yc*_?eg*"
+
+
+def match_experiment_json(names: Iterable[str]) -> List[str]:
+    found = []
+    for name in names:
+        for var in EXPERIMENT_JSON_VARIANTS:
+            matched = re.match(var, name)
+            if matched:
+                found.append(matched.string)
+    return found
+
+
+def match_img_dirs(names: Iterable[str]) -> List[str]:
+    # same as glob, names starting with a dot are hidden
+    return fnmatch_filter([n for n in names if not n.startswith(".")], IMG_DIR_PATTERN)
+
+
+@dataclass
+class DatasetInventory:
+    """Contents of the dataset directory found by a single scan.
+    The methods raise the same errors as the checks of the separate files did.
+    """
+
+    dataset_path: Path
+    entry_names: Set[str]
+    experiment_json_names: List[str]
+    img_dir_names: List[str]
+
+    def get_experiment_json_path(self) -> Path:
+        if len(self.experiment_json_names) > 1:
+            msg = "Found several options of experiment file: " + str(
+                EXPERIMENT_JSON_VARIANTS
+            )
+            raise ValueError(msg)
+        elif len(self.experiment_json_names) == 0:
+            msg = "File experiment json is not found."
+            raise ValueError(msg)
+        return self.dataset_path / self.experiment_json_names[0]
+
+    def get_sidecar_paths(self) -> Dict[str, Path]:
+        """Returns {sidecar: path} of the found variant of each required metadata file"""
+        found_files = dict()
+        absent_files = []
+        for sidecar, variants in SIDECAR_VARIANTS.items():
+            found = [f for f in variants if f in self.entry_names]
+            if len(found) > 1:
+                msg = f"Found several options of {sidecar} file: " + str(found)
+                raise ValueError(msg)
+            elif len(found) == 0:
+                absent_files.append(" or ".join(variants))
+            else:
+                found_files[sidecar] = self.dataset_path / found[0]
+        if len(absent_files) > 0:
+            required_files = [" or ".join(v) for v in SIDECAR_VARIANTS.values()]
+            msg = (
+                f"The following required metadata files are absent {str(absent_files)}. "
+                + f" These files {str(required_files)}"
+                + f" must be present in the specified dataset folder {str(self.dataset_path)}"
+            )
+            raise FileNotFoundError(msg)
+        return found_files
+
+    def get_optional_path(self, name: str) -> Union[None, Path]:
+        if name not in self.entry_names:
+            return None
+        return self.dataset_path / name
+
+    def get_img_dirs(self) -> List[Path]:
+        if self.img_dir_names == []:
+            msg = "No directories with images found. They must follow this pattern cyc001_reg001"
+            raise ValueError(msg)
+        img_dirs = [str(self.dataset_path / name) for name in self.img_dir_names]
+        img_dirs = sorted(img_dirs, key=alpha_num_order)
+        return [Path(p) for p in img_dirs]
+
+
+def probe_dataset(dataset_path: Path) -> DatasetInventory:
+    """Scans the dataset directory once, on network shares every
+    separate lookup of a file is a round trip to the server
+    """
+    try:
+        with limit_read(None), os.scandir(dataset_path) as it:
+            entries = list(it)
+    except FileNotFoundError:
+        msg = f"Specified input directory {dataset_path} does not exist"
+        raise FileNotFoundError(msg)
+
+    entry_names = {e.name for e in entries}
+    experiment_json_names = match_experiment_json(e.name for e in entries)
+    return DatasetInventory(
+        dataset_path=dataset_path,
+        entry_names=entry_names,
+        experiment_json_names=experiment_json_names,
+        img_dir_names=match_img_dirs(e.name for e in entries),
+    )
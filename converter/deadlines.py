@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Union
+
+# Stages of the conversion of a dataset, each can have its own deadline
+STAGES = ("probe", "metadata", "listing", "headers")
+# seconds after the dataset timeout, for the cooperative cancellation to stop
+# the conversion, before the worker process is killed
+KILL_GRACE = 10.0
+
+
+class DatasetTimeoutError(TimeoutError):
+    pass
+
+
+# Timeouts configured for this process with configure_deadlines and the
+# deadlines of the dataset that is being converted, as time.monotonic() values.
+# The threads that read the images of the dataset check the same deadlines,
+# so the work in flight stops at the next check once the dataset is cancelled.
+_dataset_timeout = None
+_stage_timeout = None
+_dataset_deadline = None
+_stage_deadlines = dict()
+_cancelled = threading.Event()
+_timed_out = False
+
+
+def configure_deadlines(
+    dataset_timeout: Union[None, float] = None,
+    stage_timeout: Union[None, float] = None,
+):
+    global _dataset_timeout, _stage_timeout
+    _dataset_timeout = dataset_timeout
+    _stage_timeout = stage_timeout
+
+
+def start_dataset():
+    """Starts the deadlines of a new dataset"""
+    global _dataset_deadline, _timed_out
+    _stage_deadlines.clear()
+    _cancelled.clear()
+    _timed_out = False
+    _dataset_deadline = None
+    if _dataset_timeout is not None:
+        _dataset_deadline = time.monotonic() + _dataset_timeout
+
+
+def start_stage(stage: str):
+    if _stage_timeout is not None:
+        _stage_deadlines[stage] = time.monotonic() + _stage_timeout
+
+
+def cancel_dataset():
+    """Makes the work of the dataset that is still in flight stop at its next check"""
+    _cancelled.set()
+
+
+def check_deadline(stage: str):
+    """Raises DatasetTimeoutError if the dataset or the stage is past its deadline
+    or the dataset was cancelled
+    """
+    global _timed_out
+    if _cancelled.is_set():
+        msg = f"Conversion of the dataset was cancelled in stage {stage}"
+        raise DatasetTimeoutError(msg)
+    now = time.monotonic()
+    if _dataset_deadline is not None and now > _dataset_deadline:
+        _timed_out = True
+        msg = (
+            f"Conversion of the dataset exceeded the timeout of {_dataset_timeout:g}"
+            + f" seconds in stage {stage}"
+        )
+        raise DatasetTimeoutError(msg)
+    stage_deadline = _stage_deadlines.get(stage)
+    if stage_deadline is not None and now > stage_deadline:
+        _timed_out = True
+        msg = f"Stage {stage} exceeded the timeout of {_stage_timeout:g} seconds"
+        raise DatasetTimeoutError(msg)
+
+
+def has_timed_out() -> bool:
+    """True if the conversion of the current dataset stopped at a deadline"""
+    return _timed_out
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import re
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+converter_dir = Path(__file__).parent.absolute()
+import_time_pattern = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import_times(module: str) -> Dict[str, Tuple[int, int, int]]:
+    """Returns {module: (self us, cumulative us, nesting level)}
+    parsed from the output of python -X importtime
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=converter_dir,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    import_times = dict()
+    for line in proc.stderr.splitlines():
+        if m := import_time_pattern.match(line):
+            self_us, cumulative_us, indent, name = m.groups()
+            level = (len(indent) - 1) // 2
+            import_times[name] = (int(self_us), int(cumulative_us), level)
+    return import_times
+
+
+def measure_cli_start(num_runs: int) -> List[float]:
+    """Wall-clock seconds of converter.py --help, includes interpreter startup"""
+    timings = []
+    for _ in range(num_runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "converter.py", "--help"],
+            cwd=converter_dir,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main(budget_ms: float, num_runs: int, top: int) -> bool:
+    import_times = measure_import_times("converter")
+    total_ms = import_times["converter"][1] / 1000
+
+    print(f"The {top} slowest imports pulled in by converter:")
+    slowest = sorted(import_times.items(), key=lambda x: x[1][1], reverse=True)
+    for name, (self_us, cumulative_us, level) in slowest[1 : top + 1]:
+        print(f"{cumulative_us / 1000:10.1f} ms  {'  ' * level}{name}")
+
+    timings = sorted(measure_cli_start(num_runs))
+    median_ms = timings[len(timings) // 2] * 1000
+    print(f"import converter: {total_ms:.1f} ms, budget {budget_ms:.1f} ms")
+    print(f"converter.py --help: median {median_ms:.1f} ms of {num_runs} runs")
+
+    within_budget = total_ms <= budget_ms
+    if not within_budget:
+        print("Import time is over the budget")
+    return within_budget
+
+
+if __name__ == "__main__":
+    p = ArgumentParser()
+    p.add_argument("--budget-ms", type=float, default=100)
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--top", type=int, default=15)
+    args = p.parse_args()
+
+    within_budget = main(args.budget_ms, args.runs, args.top)
+    sys.exit(0 if within_budget else 1)
@@ -0,0 +1,619 @@
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple, Union
+
+STAT_THREADS = 16
+LIMIT_KEYS = ("max_datasets", "max_reads", "max_mb_per_s", "min_reads")
+# upper bound of the adaptive concurrency if max_reads is not given
+ADAPTIVE_MAX_READS = 32
+# completed requests in a measurement window, at least this
+# and at least WINDOW_PER_LIMIT times the current concurrency
+MIN_WINDOW = 8
+WINDOW_PER_LIMIT = 2
+# more concurrency is kept if it raised the throughput by this fraction
+# or if the latency stays below LATENCY_BACKOFF times the lowest seen latency
+THROUGHPUT_GAIN = 0.05
+LATENCY_BACKOFF = 1.5
+DECREASE_FACTOR = 0.75
+# seconds of the rate that the bandwidth and iops limits let through at once
+BURST_SECONDS = 0.1
+
+# Example of the config, every key is optional, 0 or absent means no limit:
+#
+# [default]            # storage that is not listed below
+# max_reads = 8
+#
+# [[mount]]
+# path = "/mnt/nas1"   # any directory on the device
+# max_datasets = 2     # datasets converted at the same time
+# max_reads = 4        # image headers read at the same time
+# max_mb_per_s = 100   # bandwidth of the image header reads
+#
+# [[mount]]
+# path = "/mnt/smb"
+# adaptive = true      # concurrency of the reads is found while converting,
+# min_reads = 1        # between min_reads
+# max_reads = 16       # and max_reads, or ADAPTIVE_MAX_READS
+
+
+class MountLimits(NamedTuple):
+    name: str
+    max_datasets: int = 0
+    max_reads: int = 0
+    max_mb_per_s: float = 0
+    min_reads: int = 0
+    adaptive: bool = False
+
+
+class IOConfig(NamedTuple):
+    default: MountLimits
+    # {st_dev: limits}
+    mounts: Dict[int, MountLimits]
+
+
+def read_toml(config_path: Path) -> Dict[str, Any]:
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            msg = "Reading the io config requires Python 3.11 or the tomli package"
+            raise ImportError(msg)
+    with open(config_path, "rb") as s:
+        return tomllib.load(s)
+
+
+def read_mount_limits(name: str, table: Dict[str, Any]) -> MountLimits:
+    unknown_keys = set(table.keys()) - set(LIMIT_KEYS) - {"path", "adaptive"}
+    if unknown_keys:
+        msg = f"Unknown keys {sorted(unknown_keys)} of {name} in the io config"
+        raise ValueError(msg)
+    values = dict()
+    for key in LIMIT_KEYS:
+        value = table.get(key, 0)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            msg = f"Value of {key} of {name} in the io config must be a number >= 0"
+            raise ValueError(msg)
+        values[key] = value
+    adaptive = table.get("adaptive", False)
+    if not isinstance(adaptive, bool):
+        msg = f"Value of adaptive of {name} in the io config must be true or false"
+        raise ValueError(msg)
+    return MountLimits(
+        name,
+        int(values["max_datasets"]),
+        int(values["max_reads"]),
+        values["max_mb_per_s"],
+        int(values["min_reads"]),
+        adaptive,
+    )
+
+
+def load_io_config(config_path: Path) -> IOConfig:
+    """Reads limits of the mounts, the mounts are identified by their
+    device, so all directories of one device share its limits
+    """
+    config = read_toml(config_path)
+    default = read_mount_limits("default", config.get("default", dict()))
+    mounts = dict()
+    for table in config.get("mount", []):
+        if "path" not in table:
+            msg = "Every mount in the io config must have a path"
+            raise ValueError(msg)
+        try:
+            device = os.stat(table["path"]).st_dev
+        except OSError as e:
+            msg = f"Mount {table['path']} in the io config is not accessible: {e}"
+            raise ValueError(msg)
+        mounts[device] = read_mount_limits(table["path"], table)
+    return IOConfig(default, mounts)
+
+
+def get_mount_limits(config: IOConfig, device: int) -> MountLimits:
+    return config.mounts.get(device, config.default)
+
+
+def format_limits(limits: MountLimits) -> str:
+    parts = []
+    for key, unit in zip(LIMIT_KEYS, ("datasets", "reads", "MB/s")):
+        value = getattr(limits, key)
+        parts.append(f"{value} {unit}" if value > 0 else f"unlimited {unit}")
+    if limits.adaptive:
+        min_reads, max_reads = get_adaptive_bounds(limits)
+        parts[1] = f"adaptive {min_reads}-{max_reads} reads"
+    return ", ".join(parts)
+
+
+def get_adaptive_bounds(limits: MountLimits) -> Tuple[int, int]:
+    max_reads = limits.max_reads if limits.max_reads > 0 else ADAPTIVE_MAX_READS
+    min_reads = min(max(limits.min_reads, 1), max_reads)
+    return min_reads, max_reads
+
+
+def get_device(path: Path) -> Union[None, int]:
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+
+
+def get_devices(
+    paths: List[Path], num_threads: int = STAT_THREADS
+) -> Dict[Path, Union[None, int]]:
+    """Returns {path: st_dev}, None for paths that are not accessible"""
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        return dict(zip(paths, executor.map(get_device, paths)))
+
+
+class TokenBucket:
+    """Limits the rate of a quantity, e.g. bytes per second, for all processes
+    sharing the bucket. The bucket starts empty and holds at most burst_seconds
+    of the rate, so even short runs stay within the rate. A request larger
+    than the burst is allowed and makes the following requests wait
+    until it is paid off.
+    """
+
+    def __init__(self, rate: float, burst_seconds: float = BURST_SECONDS):
+        from multiprocessing import Array
+
+        self.rate = rate
+        self.capacity = rate * burst_seconds
+        # tokens, time of the last update
+        self.state = Array("d", [0.0, time.monotonic()])
+
+    def acquire(self, amount: float) -> float:
+        """Takes the amount and waits until it is available,
+        returns the seconds waited
+        """
+        with self.state.get_lock():
+            now = time.monotonic()
+            tokens = self.state[0] + (now - self.state[1]) * self.rate
+            tokens = min(tokens, self.capacity) - amount
+            self.state[0] = tokens
+            self.state[1] = now
+        if tokens >= 0:
+            return 0.0
+        wait_seconds = -tokens / self.rate
+        time.sleep(wait_seconds)
+        return wait_seconds
+
+
+class FixedLimiter:
+    def __init__(self, limit: int):
+        from multiprocessing import BoundedSemaphore
+
+        self.max_limit = limit
+        self.semaphore = BoundedSemaphore(limit)
+
+    def acquire(self):
+        self.semaphore.acquire()
+
+    def release(self, latency: float, failed: bool = False):
+        self.semaphore.release()
+
+
+class AdaptiveLimiter:
+    """Concurrency limit of the requests found by AIMD: it grows by one
+    after every measurement window in which more requests in flight raised
+    the throughput or did not raise the latency, and is cut by DECREASE_FACTOR
+    when the latency grew without more throughput or a request failed.
+    The state is in shared memory, so the worker processes share the limit.
+    """
+
+    # indices of the values in the shared state
+    LIMIT = 0
+    IN_FLIGHT = 1
+    # time when the requests in flight became more than 0
+    BUSY_SINCE = 2
+    # completed requests, sum of their latencies and busy time of the window
+    WINDOW_COUNT = 3
+    WINDOW_LATENCY = 4
+    WINDOW_BUSY = 5
+    LAST_THROUGHPUT = 6
+    MIN_LATENCY = 7
+    LOWEST_LIMIT = 8
+    HIGHEST_LIMIT = 9
+    NUM_ADJUSTMENTS = 10
+
+    def __init__(self, min_limit: int, max_limit: int):
+        from multiprocessing import Array, Condition
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.condition = Condition()
+        self.state = Array("d", 11, lock=False)
+        self.state[self.LIMIT] = min_limit
+        self.state[self.LOWEST_LIMIT] = min_limit
+        self.state[self.HIGHEST_LIMIT] = min_limit
+
+    def acquire(self):
+        with self.condition:
+            while self.state[self.IN_FLIGHT] >= int(self.state[self.LIMIT]):
+                self.condition.wait()
+            if self.state[self.IN_FLIGHT] == 0:
+                self.state[self.BUSY_SINCE] = time.monotonic()
+            self.state[self.IN_FLIGHT] += 1
+
+    def release(self, latency: float, failed: bool = False):
+        with self.condition:
+            state = self.state
+            state[self.IN_FLIGHT] -= 1
+            if state[self.IN_FLIGHT] == 0:
+                # idle time between the requests is not counted in the throughput
+                state[self.WINDOW_BUSY] += time.monotonic() - state[self.BUSY_SINCE]
+            state[self.WINDOW_COUNT] += 1
+            state[self.WINDOW_LATENCY] += latency
+            if failed:
+                self.set_limit(state[self.LIMIT] * DECREASE_FACTOR)
+                self.reset_window()
+            elif state[self.WINDOW_COUNT] >= max(
+                MIN_WINDOW, WINDOW_PER_LIMIT * state[self.LIMIT]
+            ):
+                self.adjust()
+            self.condition.notify_all()
+
+    def adjust(self):
+        state = self.state
+        busy = state[self.WINDOW_BUSY]
+        if state[self.IN_FLIGHT] > 0:
+            busy += time.monotonic() - state[self.BUSY_SINCE]
+            state[self.BUSY_SINCE] = time.monotonic()
+        throughput = state[self.WINDOW_COUNT] / max(busy, 1e-9)
+        latency = state[self.WINDOW_LATENCY] / state[self.WINDOW_COUNT]
+        if state[self.MIN_LATENCY] == 0 or latency < state[self.MIN_LATENCY]:
+            state[self.MIN_LATENCY] = latency
+        gained = throughput > state[self.LAST_THROUGHPUT] * (1 + THROUGHPUT_GAIN)
+        queued = latency > state[self.MIN_LATENCY] * LATENCY_BACKOFF
+        if gained or not queued:
+            self.set_limit(state[self.LIMIT] + 1)
+        else:
+            self.set_limit(state[self.LIMIT] * DECREASE_FACTOR)
+        state[self.LAST_THROUGHPUT] = throughput
+        self.reset_window()
+
+    def set_limit(self, limit: float):
+        state = self.state
+        limit = min(max(limit, self.min_limit), self.max_limit)
+        if int(limit) != int(state[self.LIMIT]):
+            state[self.NUM_ADJUSTMENTS] += 1
+        state[self.LIMIT] = limit
+        state[self.LOWEST_LIMIT] = min(state[self.LOWEST_LIMIT], limit)
+        state[self.HIGHEST_LIMIT] = max(state[self.HIGHEST_LIMIT], limit)
+
+    def reset_window(self):
+        self.state[self.WINDOW_COUNT] = 0
+        self.state[self.WINDOW_LATENCY] = 0
+        self.state[self.WINDOW_BUSY] = 0
+
+    def get_summary(self) -> Dict[str, float]:
+        with self.condition:
+            return {
+                "limit": int(self.state[self.LIMIT]),
+                "lowest": int(self.state[self.LOWEST_LIMIT]),
+                "highest": int(self.state[self.HIGHEST_LIMIT]),
+                "adjustments": int(self.state[self.NUM_ADJUSTMENTS]),
+                "min_latency": self.state[self.MIN_LATENCY],
+            }
+
+
+def is_congestion_error(error: Exception) -> bool:
+    # missing files and denied access are not caused by the load of the storage
+    not_load_errors = (FileNotFoundError, NotADirectoryError, PermissionError)
+    return isinstance(error, OSError) and not isinstance(error, not_load_errors)
+
+
+class DeviceThrottle:
+    """Limits of one device, shared by all worker processes when
+    created before the process pool and passed to its initializer
+    """
+
+    def __init__(self, limits: MountLimits):
+        self.limits = limits
+        self.reads = None
+        self.bandwidth = None
+        if limits.adaptive:
+            self.reads = AdaptiveLimiter(*get_adaptive_bounds(limits))
+        elif limits.max_reads > 0:
+            self.reads = FixedLimiter(limits.max_reads)
+        if limits.max_mb_per_s > 0:
+            self.bandwidth = TokenBucket(limits.max_mb_per_s * 1024**2)
+
+    def get_max_concurrency(self) -> int:
+        return 1 if self.reads is None else self.reads.max_limit
+
+    @contextmanager
+    def read(self, num_bytes: int):
+        if self.reads is not None:
+            self.reads.acquire()
+        failed = False
+        start = time.monotonic()
+        try:
+            if self.bandwidth is not None:
+                self.bandwidth.acquire(num_bytes)
+                # latency is measured without the wait for the bandwidth
+                start = time.monotonic()
+            yield
+        except Exception as e:
+            failed = is_congestion_error(e)
+            raise
+        finally:
+            if self.reads is not None:
+                self.reads.release(time.monotonic() - start, failed)
+
+
+class RateLimiter:
+    """Ceilings of the bandwidth and of the operations per second of all reads,
+    regardless of the device, shared by all worker processes. Keeps totals
+    of the reads and of the time they waited for the limits.
+    """
+
+    # indices of the totals
+    BYTES = 0
+    OPERATIONS = 1
+    BANDWIDTH_WAIT = 2
+    OPERATIONS_WAIT = 3
+    NUM_DELAYED = 4
+    # time.monotonic() of the first read, the rates are measured from it
+    FIRST_READ = 5
+
+    def __init__(
+        self,
+        max_mb_per_s: float = 0,
+        max_iops: float = 0,
+        burst_seconds: float = BURST_SECONDS,
+    ):
+        from multiprocessing import Array
+
+        self.max_mb_per_s = max_mb_per_s
+        self.max_iops = max_iops
+        self.bandwidth = None
+        self.operations = None
+        if max_mb_per_s > 0:
+            self.bandwidth = TokenBucket(max_mb_per_s * 1024**2, burst_seconds)
+        if max_iops > 0:
+            self.operations = TokenBucket(max_iops, burst_seconds)
+        self.totals = Array("d", 6)
+
+    def throttle(self, num_bytes: int, num_operations: int = 1):
+        if self.totals[self.FIRST_READ] == 0:
+            with self.totals.get_lock():
+                if self.totals[self.FIRST_READ] == 0:
+                    self.totals[self.FIRST_READ] = time.monotonic()
+        operations_wait = 0.0
+        bandwidth_wait = 0.0
+        if self.operations is not None:
+            operations_wait = self.operations.acquire(num_operations)
+        if self.bandwidth is not None and num_bytes > 0:
+            bandwidth_wait = self.bandwidth.acquire(num_bytes)
+        with self.totals.get_lock():
+            self.totals[self.BYTES] += num_bytes
+            self.totals[self.OPERATIONS] += num_operations
+            self.totals[self.BANDWIDTH_WAIT] += bandwidth_wait
+            self.totals[self.OPERATIONS_WAIT] += operations_wait
+            if bandwidth_wait > 0 or operations_wait > 0:
+                self.totals[self.NUM_DELAYED] += 1
+
+    def get_summary(self) -> Dict[str, float]:
+        with self.totals.get_lock():
+            totals = self.totals[:]
+        elapsed = 0.0
+        if totals[self.FIRST_READ] > 0:
+            elapsed = time.monotonic() - totals[self.FIRST_READ]
+        elapsed = max(elapsed, 1e-9)
+        return {
+            "bytes": totals[self.BYTES],
+            "operations": int(totals[self.OPERATIONS]),
+            "delayed": int(totals[self.NUM_DELAYED]),
+            "bandwidth_wait": totals[self.BANDWIDTH_WAIT],
+            "operations_wait": totals[self.OPERATIONS_WAIT],
+            "bytes_per_s": totals[self.BYTES] / elapsed,
+            "iops": totals[self.OPERATIONS] / elapsed,
+        }
+
+
+def create_rate_limiter(
+    max_mb_per_s: Union[None, float], max_iops: Union[None, float]
+) -> Union[None, RateLimiter]:
+    if not max_mb_per_s and not max_iops:
+        return None
+    return RateLimiter(max_mb_per_s or 0, max_iops or 0)
+
+
+def lower_io_priority() -> List[str]:
+    """Lowers the CPU and I/O priority of this process, so the reads
+    give way to other programs, e.g. the acquisition writing images.
+    Returns descriptions of the changes that were applied.
+    """
+    applied = []
+    if os.name == "nt":
+        import ctypes
+
+        # lowers the CPU, I/O and memory priority of the process
+        process_mode_background_begin = 0x00100000
+        kernel32 = ctypes.windll.kernel32
+        if kernel32.SetPriorityClass(
+            kernel32.GetCurrentProcess(), process_mode_background_begin
+        ):
+            applied.append("background mode")
+        return applied
+
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, 19)
+        applied.append("nice 19")
+    except (AttributeError, OSError):
+        pass
+    ionice_path = shutil.which("ionice")
+    if ionice_path is not None:
+        import subprocess
+
+        # best effort class with the lowest priority, the idle class
+        # could stop the conversion while the disk is busy
+        command = [ionice_path, "-c", "2", "-n", "7", "-p", str(os.getpid())]
+        result = subprocess.run(command, capture_output=True)
+        if result.returncode == 0:
+            applied.append("ionice best-effort 7")
+    return applied
+
+
+# Limits of this process, configured with configure_io_limits.
+# Throttles of devices that were not known before the process pool was
+# started are created on first use and are not shared with other processes.
+_io_config = None
+_throttles = dict()
+_rate_limiter = None
+# {device: summary} of the adaptive limits reported by the worker processes
+_reported_summaries = dict()
+
+
+def create_throttles(config: IOConfig, devices: List[int]) -> Dict[int, DeviceThrottle]:
+    return {d: DeviceThrottle(get_mount_limits(config, d)) for d in set(devices)}
+
+
+def configure_io_limits(
+    config: Union[None, IOConfig] = None,
+    throttles: Union[None, Dict[int, DeviceThrottle]] = None,
+    rate_limiter: Union[None, RateLimiter] = None,
+):
+    global _io_config, _throttles, _rate_limiter
+    _io_config = config
+    _throttles = dict() if throttles is None else dict(throttles)
+    _rate_limiter = rate_limiter
+
+
+def get_adaptive_summaries() -> Dict[int, Dict[str, Any]]:
+    """{device: summary} of the adaptive limits of the reads of this process"""
+    summaries = dict()
+    for device, throttle in list(_throttles.items()):
+        if throttle.limits.adaptive:
+            summaries[device] = throttle.reads.get_summary()
+            summaries[device]["name"] = throttle.limits.name
+    return summaries
+
+
+def add_reported_summaries(summaries: Dict[int, Dict[str, Any]]):
+    """Keeps the summaries sent by a worker process, the latest for each device"""
+    _reported_summaries.update(summaries)
+
+
+def get_reported_summaries() -> Dict[int, Dict[str, Any]]:
+    return dict(_reported_summaries)
+
+
+def get_limited_device(path: Path) -> Union[None, int]:
+    """Device of the path if its reads are limited, without a stat otherwise"""
+    if _io_config is None:
+        return None
+    return get_device(path)
+
+
+def get_throttle(device: Union[None, int]) -> Union[None, DeviceThrottle]:
+    if _io_config is None or device is None:
+        return None
+    if device not in _throttles:
+        # setdefault keeps one throttle if several threads create it at once
+        throttle = DeviceThrottle(get_mount_limits(_io_config, device))
+        _throttles.setdefault(device, throttle)
+    return _throttles[device]
+
+
+@contextmanager
+def limit_read(device: Union[None, int], num_bytes: int = 0):
+    """Waits until the read of num_bytes from the device is within its limits.
+    A read of 0 bytes, e.g. a directory listing, counts as one operation.
+    """
+    if _rate_limiter is not None:
+        # waits before taking a place among the concurrent reads of the device
+        _rate_limiter.throttle(num_bytes)
+    throttle = get_throttle(device)
+    if throttle is None:
+        yield
+    else:
+        with throttle.read(num_bytes):
+            yield
+
+
+@contextmanager
+def limit_file_read(file_path: Path):
+    """Limits the read of the whole file, its size is looked up only if
+    the reads are limited
+    """
+    if _rate_limiter is None and _io_config is None:
+        yield
+    else:
+        file_stat = os.stat(file_path)
+        with limit_read(file_stat.st_dev, file_stat.st_size):
+            yield
+
+
+def map_reads(
+    func: Callable, paths: List[Path], device: Union[None, int] = None
+) -> List[Any]:
+    """Returns [func(path)] computed in as many threads as reads allowed
+    on the device of the paths, errors are raised in the order of the paths
+    """
+    num_threads = 1
+    if len(paths) > 1:
+        if device is None:
+            device = get_limited_device(paths[0])
+        throttle = get_throttle(device)
+        if throttle is not None:
+            num_threads = throttle.get_max_concurrency()
+    if num_threads <= 1:
+        return [func(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=min(num_threads, len(paths))) as executor:
+        return list(executor.map(func, paths))
+
+
+class DatasetDispatcher:
+    """Hands out datasets in the given order, skipping datasets
+    of the devices that already convert their max_datasets datasets
+    """
+
+    def __init__(
+        self,
+        datasets: List[Path],
+        devices: Union[None, Dict[Path, Union[None, int]]] = None,
+        config: Union[None, IOConfig] = None,
+    ):
+        # without a config all datasets are in one queue without a limit
+        self.devices = dict() if devices is None else devices
+        self.max_datasets = dict()
+        # {device: deque of (position in the order, dataset)}
+        self.queues = dict()
+        for position, dataset in enumerate(datasets):
+            device = self.devices.get(dataset)
+            if device not in self.queues:
+                self.queues[device] = deque()
+                limit = 0
+                if device is not None and config is not None:
+                    limit = get_mount_limits(config, device).max_datasets
+                self.max_datasets[device] = limit
+            self.queues[device].append((position, dataset))
+        self.running = {device: 0 for device in self.queues}
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+    def next_dataset(self) -> Union[None, Path]:
+        """Returns the first dataset in the order whose device is below
+        its limit, or None if all remaining datasets have to wait
+        """
+        candidates = []
+        for device, queue in self.queues.items():
+            limit = self.max_datasets[device]
+            if queue and (limit <= 0 or self.running[device] < limit):
+                candidates.append((queue[0][0], device))
+        if candidates == []:
+            return None
+        _, device = min(candidates)
+        self.running[device] += 1
+        return self.queues[device].popleft()[1]
+
+    def dataset_done(self, dataset: Path):
+        self.running[self.devices.get(dataset)] -= 1
@@ -0,0 +1,108 @@
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Set, Union
+
+JOURNAL_NAME = "journal.jsonl"
+
+
+def get_journal_path(workdir: Path) -> Path:
+    return workdir / JOURNAL_NAME
+
+
+def fsync_dir(dir_path: Path):
+    # persists creation of a new file in the directory, not supported on Windows
+    if os.name == "nt":
+        return
+    fd = os.open(str(dir_path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def ends_with_newline(file_path: Path) -> bool:
+    with open(file_path, "rb") as s:
+        s.seek(0, os.SEEK_END)
+        if s.tell() == 0:
+            return True
+        s.seek(-1, os.SEEK_END)
+        return s.read(1) == b"\n"
+
+
+def append_entry(journal_path: Path, entry: dict):
+    """Each entry is a single line written with one write call
+    to a file opened in append mode and then fsynced,
+    so a crash can leave at most one incomplete last line.
+    """
+    entry = dict(entry, time=datetime.now().isoformat(timespec="seconds"))
+    line = (json.dumps(entry) + "\n").encode("utf-8")
+    is_new = not journal_path.exists()
+    if not is_new and not ends_with_newline(journal_path):
+        # terminate the incomplete line so that it does not corrupt this entry
+        line = b"\n" + line
+    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    fd = os.open(str(journal_path), flags, 0o644)
+    try:
+        os.write(fd, line)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    if is_new:
+        fsync_dir(journal_path.parent)
+
+
+def record_batch_start(journal_path: Path, resume: bool):
+    append_entry(journal_path, {"event": "batch_start", "resume": resume})
+
+
+def record_outcome(
+    journal_path: Path,
+    input_dir: Path,
+    out_dir: Path,
+    outcome: str,
+    error: Union[None, str] = None,
+    seconds: Union[None, float] = None,
+    estimated_seconds: Union[None, float] = None,
+):
+    entry = {
+        "event": "dataset",
+        "input_dir": str(input_dir),
+        "output_dir": str(out_dir),
+        "outcome": outcome,
+    }
+    if error is not None:
+        entry["error"] = error
+    if seconds is not None:
+        entry["seconds"] = round(seconds, 3)
+    if estimated_seconds is not None:
+        entry["estimated_seconds"] = round(estimated_seconds, 3)
+    append_entry(journal_path, entry)
+
+
+def read_outcomes(journal_path: Path) -> Dict[str, str]:
+    """Returns {input_dir: outcome} with the latest outcome of each dataset
+    recorded since the last batch that was started without resume.
+    """
+    outcomes = dict()
+    if not journal_path.exists():
+        return outcomes
+    with open(journal_path, "r", encoding="utf-8") as s:
+        for line in s:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # incomplete line left by an interrupted write
+                continue
+            if entry.get("event") == "batch_start":
+                if not entry.get("resume", False):
+                    outcomes = dict()
+            elif entry.get("event") == "dataset":
+                outcomes[entry["input_dir"]] = entry["outcome"]
+    return outcomes
+
+
+def get_completed_datasets(journal_path: Path) -> Set[str]:
+    outcomes = read_outcomes(journal_path)
+    return {ds for ds, outcome in outcomes.items() if outcome == "success"}
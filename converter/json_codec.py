@@ -0,0 +1,91 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Union
+
+# Fast json backend, orjson or msgspec if one of them is installed,
+# found on first use, so that the import of this module stays cheap.
+# The backends are stricter than the json module, e.g. they reject NaN,
+# whatever they reject is decoded again with the json module, so the result
+# and the error messages are always the same as with json.loads.
+_backend = None
+
+
+def get_backend() -> str:
+    global _backend
+    if _backend is None:
+        _backend = "json"
+        for name in ("orjson", "msgspec"):
+            try:
+                __import__(name)
+            except ImportError:
+                continue
+            _backend = name
+            break
+    return _backend
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    backend = get_backend()
+    if backend == "orjson":
+        import orjson
+
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    elif backend == "msgspec":
+        import msgspec
+
+        try:
+            return msgspec.json.decode(data)
+        except msgspec.DecodeError:
+            pass
+    return json.loads(data)
+
+
+def dumps(obj: Any, indent: Union[None, int] = None) -> str:
+    """With indent returns the same text as json.dumps(obj, indent=indent).
+    The backends can only indent by 2 spaces and format floats and non-ascii
+    characters differently, so indented output is always made by the json module.
+    Compact output of the backends can differ from json.dumps in spaces and escaping.
+    """
+    backend = get_backend() if indent is None else "json"
+    if backend == "orjson":
+        import orjson
+
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except orjson.JSONEncodeError:
+            pass
+    elif backend == "msgspec":
+        import msgspec
+
+        try:
+            return msgspec.json.encode(obj).decode("utf-8")
+        except (TypeError, msgspec.EncodeError):
+            pass
+    return json.dumps(obj, indent=indent)
+
+
+def read_json_file(path: Path) -> Any:
+    with open(path, "rb") as s:
+        return loads(s.read())
+
+
+def write_json_file(path: Path, obj: Any, indent: Union[None, int] = 4):
+    """Writes the same file as json.dump(obj, s, indent=indent).
+    The file is written to a temporary file and renamed,
+    so a reader never sees a partially written file.
+    """
+    text = dumps(obj, indent)
+    tmp_path = path.with_name(path.name + f".tmp{os.getpid()}")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as s:
+            s.write(text)
+            s.flush()
+            os.fsync(s.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
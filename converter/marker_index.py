@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import re
+import sqlite3
+from argparse import ArgumentParser
+from difflib import get_close_matches
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple
+
+MARKER_INDEX_NAME = "marker_index.sqlite"
+# indexed field: name of the field in ChannelDetailsArray
+INDEXED_FIELDS = {"marker": "Name", "fluorophore": "Fluorophore"}
+FUZZY_CUTOFF = 0.75
+MAX_FUZZY_TERMS = 10
+# shortest known term that is matched as a prefix of the queried term
+MIN_PREFIX_LEN = 2
+
+CREATE_STATEMENTS = [
+    # postings are clustered by (field, term), so a lookup reads adjacent rows
+    "CREATE TABLE IF NOT EXISTS postings ("
+    + "Field TEXT NOT NULL, Term TEXT NOT NULL, Value TEXT NOT NULL, "
+    + "Dataset TEXT NOT NULL, CycleID INTEGER NOT NULL, ChannelID INTEGER NOT NULL, "
+    + "PRIMARY KEY (Field, Term, Dataset, CycleID, ChannelID)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS postings_dataset ON postings (Dataset)",
+    # vocabulary for the fuzzy matching, without scanning the postings
+    "CREATE TABLE IF NOT EXISTS terms ("
+    + "Field TEXT NOT NULL, Term TEXT NOT NULL, PRIMARY KEY (Field, Term)) WITHOUT ROWID",
+]
+
+
+class Posting(NamedTuple):
+    field: str
+    term: str
+    value: str
+    dataset: str
+    cycle_id: int
+    channel_id: int
+
+
+def normalize_term(value: str) -> str:
+    """Case and punctuation insensitive form of marker or fluorophore name,
+    e.g. "CD3-e" and "cd3 E" both become "cd3e"
+    """
+    return re.sub(r"[\W_]+", "", str(value)).casefold()
+
+
+def get_marker_index_path(workdir: Path) -> Path:
+    return workdir / MARKER_INDEX_NAME
+
+
+def open_marker_index(index_path: Path) -> sqlite3.Connection:
+    # locks of SQLite are not reliable on network shares, so --distributed
+    # workers do not write the index. Another run on the same computer
+    # can write to it, wait for its transactions.
+    conn = sqlite3.connect(str(index_path), timeout=60)
+    with conn:
+        for statement in CREATE_STATEMENTS:
+            conn.execute(statement)
+    return conn
+
+
+def upsert_dataset(
+    conn: sqlite3.Connection, input_dir: Path, out_dir: Path, metadata: Dict[str, Any]
+):
+    """Replaces postings of the dataset in one transaction"""
+    dataset = str(input_dir)
+    channels = metadata.get("ChannelDetails", dict()).get("ChannelDetailsArray", [])
+    postings = set()
+    for channel in channels:
+        for field, channel_field in INDEXED_FIELDS.items():
+            value = str(channel[channel_field])
+            postings.add(
+                Posting(
+                    field,
+                    normalize_term(value),
+                    value,
+                    dataset,
+                    channel["CycleID"],
+                    channel["ChannelID"],
+                )
+            )
+    with conn:
+        conn.execute("DELETE FROM postings WHERE Dataset = ?", (dataset,))
+        conn.executemany("INSERT INTO postings VALUES (?, ?, ?, ?, ?, ?)", postings)
+        conn.executemany(
+            "INSERT OR IGNORE INTO terms VALUES (?, ?)",
+            {(p.field, p.term) for p in postings},
+        )
+
+
+def find_terms(conn: sqlite3.Connection, field: str, term: str) -> List[str]:
+    """Returns known terms similar to the term: the term itself,
+    terms that start with it, terms it starts with ("CD3e" and "CD3"),
+    and close matches by edit similarity. Numbers are a part of the name,
+    if the term has numbers the similar terms must have the same numbers,
+    so "CD3" does not match "CD31" or "CD34".
+    """
+    found = [term]
+    rows = conn.execute(
+        "SELECT Term FROM terms WHERE Field = ? AND Term > ? AND Term < ?",
+        (field, term, term + "\U0010ffff"),
+    )
+    found.extend(r[0] for r in rows)
+    prefixes = [term[:i] for i in range(MIN_PREFIX_LEN, len(term))]
+    if prefixes != []:
+        rows = conn.execute(
+            "SELECT Term FROM terms WHERE Field = ? AND Term IN "
+            + f"({', '.join('?' * len(prefixes))})",
+            [field] + prefixes,
+        )
+        found.extend(r[0] for r in rows)
+    vocabulary = [
+        r[0] for r in conn.execute("SELECT Term FROM terms WHERE Field = ?", (field,))
+    ]
+    found.extend(
+        get_close_matches(term, vocabulary, n=MAX_FUZZY_TERMS, cutoff=FUZZY_CUTOFF)
+    )
+    numbers = re.findall(r"\d+", term)
+    if numbers != []:
+        found = [t for t in found if re.findall(r"\d+", t) == numbers]
+    return list(dict.fromkeys(found))
+
+
+def lookup(
+    conn: sqlite3.Connection, value: str, field: str = "marker", fuzzy: bool = False
+) -> List[Posting]:
+    """Returns (dataset, CycleID, ChannelID) with the marker or fluorophore,
+    matched by the normalized name, or by similar names with fuzzy
+    """
+    if field not in INDEXED_FIELDS:
+        msg = f"Unknown field {field}, expected one of {list(INDEXED_FIELDS)}"
+        raise ValueError(msg)
+    term = normalize_term(value)
+    terms = find_terms(conn, field, term) if fuzzy else [term]
+    postings = []
+    for t in terms:
+        rows = conn.execute(
+            "SELECT * FROM postings WHERE Field = ? AND Term = ?", (field, t)
+        )
+        postings.extend(map(Posting._make, rows))
+    return postings
+
+
+if __name__ == "__main__":
+    p = ArgumentParser(description="Find datasets and channels by marker name")
+    p.add_argument("index", type=Path, help="marker_index.sqlite or the workdir")
+    p.add_argument("value", help="marker or fluorophore name")
+    p.add_argument("--field", choices=list(INDEXED_FIELDS), default="marker")
+    p.add_argument("--fuzzy", action="store_true", help="also find similar names")
+    args = p.parse_args()
+
+    index_path = args.index
+    if index_path.is_dir():
+        index_path = get_marker_index_path(index_path)
+    if not index_path.is_file():
+        p.error(f"Marker index {index_path} does not exist")
+    conn = open_marker_index(index_path)
+    for posting in lookup(conn, args.value, args.field, args.fuzzy):
+        print(
+            f"{posting.value}\t{posting.dataset}\t"
+            + f"CycleID {posting.cycle_id}\tChannelID {posting.channel_id}"
+        )
+    conn.close()
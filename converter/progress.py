@@ -0,0 +1,216 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Union
+
+COUNTER_NAMES = ("dirs", "files", "headers", "bytes")
+RENDER_INTERVAL = 0.5
+LOG_INTERVAL = 30.0
+# rates are averaged over this many seconds
+RATE_WINDOW = 10.0
+# ETA is estimated from this many latest finished datasets
+ETA_WINDOW = 20
+
+# Counters of the work done in this process, or shared by the worker processes
+# when configured with create_shared_counters. Only counters are updated
+# on the hot path, the progress line is made by the reporter thread.
+_counters = [0] * len(COUNTER_NAMES)
+_shared_counters = None
+_counter_index = {name: i for i, name in enumerate(COUNTER_NAMES)}
+_counters_lock = threading.Lock()
+_active_reporter = None
+
+
+def create_shared_counters():
+    from multiprocessing import Array
+
+    return Array("q", len(COUNTER_NAMES))
+
+
+def configure_counters(shared_counters=None):
+    global _shared_counters
+    _shared_counters = shared_counters
+
+
+def detach_reporter():
+    """Forgets the reporter inherited by a forked worker process, only the
+    parent draws the progress line and its lock can be held at the fork
+    """
+    global _active_reporter
+    _active_reporter = None
+
+
+def add_progress(name: str, amount: int = 1):
+    i = _counter_index[name]
+    if _shared_counters is None:
+        # headers and directories can be read in several threads
+        with _counters_lock:
+            _counters[i] += amount
+    else:
+        with _shared_counters.get_lock():
+            _shared_counters[i] += amount
+
+
+def get_counts() -> Dict[str, int]:
+    counters = _counters if _shared_counters is None else _shared_counters[:]
+    return dict(zip(COUNTER_NAMES, counters))
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def format_bytes(num_bytes: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+
+class ProgressReporter:
+    """Shows the progress of the batch, on a terminal as a line that is
+    redrawn in place, otherwise as a log line every LOG_INTERVAL seconds
+    """
+
+    def __init__(
+        self,
+        total_datasets: Union[None, int],
+        log_func: Callable[[str], None],
+        stream=None,
+    ):
+        self.total_datasets = total_datasets
+        self.log_func = log_func
+        self.stream = sys.stderr if stream is None else stream
+        self.is_tty = self.stream.isatty() and os.environ.get("TERM") != "dumb"
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.start_time = time.monotonic()
+        self.start_counts = get_counts()
+        self.num_done = 0
+        self.done_times = deque(maxlen=ETA_WINDOW)
+        self.samples = deque()
+        self.line = ""
+        # length of the line on the terminal, it is overwritten with spaces
+        # because the legacy Windows console does not support escape sequences
+        self.drawn_len = 0
+
+    def start(self):
+        global _active_reporter
+        _active_reporter = self
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        global _active_reporter
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        _active_reporter = None
+        self.clear_line()
+        self.log_func(self.format_line(overall=True))
+
+    def dataset_done(self):
+        with self.lock:
+            self.num_done += 1
+            self.done_times.append(time.monotonic())
+
+    def run(self):
+        last_log = time.monotonic()
+        while not self.stopped.wait(RENDER_INTERVAL):
+            line = self.format_line()
+            if self.is_tty:
+                with self.lock:
+                    self.line = line
+                    self.draw_line()
+            elif time.monotonic() - last_log >= LOG_INTERVAL:
+                last_log = time.monotonic()
+                self.log_func(line)
+
+    def draw_line(self):
+        padding = " " * max(self.drawn_len - len(self.line), 0)
+        self.stream.write("\r" + self.line + padding)
+        self.stream.flush()
+        self.drawn_len = len(self.line)
+
+    def clear_line(self):
+        if self.is_tty and self.drawn_len > 0:
+            self.stream.write("\r" + " " * self.drawn_len + "\r")
+            self.stream.flush()
+            self.drawn_len = 0
+
+    def get_rates(self, now: float, counts: Dict[str, int]) -> Dict[str, float]:
+        """Per second rates of the counters over the last RATE_WINDOW seconds"""
+        self.samples.append((now, counts))
+        while len(self.samples) > 2 and now - self.samples[0][0] > RATE_WINDOW:
+            self.samples.popleft()
+        first_time, first_counts = self.samples[0]
+        elapsed = now - first_time
+        if elapsed <= 0:
+            return {name: 0.0 for name in COUNTER_NAMES}
+        return {
+            name: (counts[name] - first_counts[name]) / elapsed
+            for name in COUNTER_NAMES
+        }
+
+    def get_eta(self, now: float) -> Union[None, float]:
+        if self.total_datasets is None or self.num_done == 0:
+            return None
+        if self.num_done >= self.total_datasets:
+            return None
+        if len(self.done_times) > 1:
+            elapsed = self.done_times[-1] - self.done_times[0]
+            rate = (len(self.done_times) - 1) / elapsed if elapsed > 0 else 0
+        else:
+            rate = self.num_done / (now - self.start_time)
+        if rate <= 0:
+            return None
+        return (self.total_datasets - self.num_done) / rate
+
+    def format_line(self, overall: bool = False) -> str:
+        """With overall the rates are averaged over the whole run"""
+        now = time.monotonic()
+        counts = get_counts()
+        counts = {n: counts[n] - self.start_counts[n] for n in COUNTER_NAMES}
+        with self.lock:
+            if overall:
+                elapsed = max(now - self.start_time, 1e-9)
+                rates = {n: counts[n] / elapsed for n in COUNTER_NAMES}
+            else:
+                rates = self.get_rates(now, counts)
+            eta = self.get_eta(now)
+            num_done = self.num_done
+        datasets = str(num_done)
+        if self.total_datasets is not None:
+            datasets += f"/{self.total_datasets}"
+        parts = [
+            f"Datasets {datasets}",
+            f"dirs {counts['dirs']}",
+            f"headers {counts['headers']}",
+            f"{rates['files']:.1f} files/s",
+            f"{format_bytes(rates['bytes'])}/s",
+            f"elapsed {format_duration(now - self.start_time)}",
+        ]
+        if eta is not None:
+            parts.append(f"ETA {format_duration(eta)}")
+        return " | ".join(parts)
+
+
+class ProgressStreamHandler(logging.StreamHandler):
+    """Console handler that keeps the progress line below the log messages"""
+
+    def emit(self, record: logging.LogRecord):
+        reporter = _active_reporter
+        if reporter is None or not reporter.is_tty:
+            super().emit(record)
+            return
+        with reporter.lock:
+            reporter.clear_line()
+            super().emit(record)
+            if reporter.line != "":
+                reporter.draw_line()
@@ -0,0 +1,163 @@
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List
+
+# json schema types of the fields, checked the same way as jsonschema does
+STRING = "string"
+INTEGER = "integer"
+NUMBER = "number"
+BOOLEAN = "boolean"
+RECORD = "record"
+
+
+def is_of_type(value: Any, json_type: str) -> bool:
+    if json_type == STRING:
+        return isinstance(value, str)
+    elif json_type == BOOLEAN:
+        return isinstance(value, bool)
+    elif isinstance(value, bool):
+        # bool is a subclass of int, but not a json number
+        return False
+    elif json_type == INTEGER:
+        return isinstance(value, int) or (
+            isinstance(value, float) and value.is_integer()
+        )
+    elif json_type == NUMBER:
+        return isinstance(value, (int, float))
+    elif json_type == RECORD:
+        return isinstance(value, Record)
+    msg = f"Unknown field type {json_type}"
+    raise NotImplementedError(msg)
+
+
+class Record:
+    """Record with a fixed set of typed fields. Subclasses declare
+    _fields = {name: json type} and __slots__ = tuple(_fields),
+    the order of the fields is the order of the keys in the output json.
+    """
+
+    __slots__ = ()
+    _fields: Dict[str, str] = {}
+
+    def __init__(self, *args, **kwargs):
+        cls_name = type(self).__name__
+        if len(args) > len(self._fields):
+            msg = f"{cls_name} has {len(self._fields)} fields, got {len(args)} values"
+            raise TypeError(msg)
+        values = dict(zip(self._fields, args))
+        for name, value in kwargs.items():
+            if name not in self._fields:
+                msg = f"{cls_name} does not have field {name}"
+                raise TypeError(msg)
+            values[name] = value
+        for name, json_type in self._fields.items():
+            if name not in values:
+                msg = f"Value of the field {name} of {cls_name} is not provided"
+                raise TypeError(msg)
+            value = values[name]
+            if not is_of_type(value, json_type):
+                msg = (
+                    f"Field {name} of {cls_name} must be of type {json_type}, "
+                    + f"got {repr(value)} of type {type(value).__name__}"
+                )
+                raise TypeError(msg)
+            setattr(self, name, value)
+
+    def __eq__(self, other) -> bool:
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{f}={repr(getattr(self, f))}" for f in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        values = (getattr(self, f) for f in self.__slots__)
+        return {
+            f: v.to_dict() if isinstance(v, Record) else v
+            for f, v in zip(self.__slots__, values)
+        }
+
+
+def records_to_dicts(records: Iterable[Record]) -> List[Dict[str, Any]]:
+    """Encodes records of the same flat type in one pass,
+    fields of all records are read with a single attrgetter
+    """
+    records = list(records)
+    if records == []:
+        return []
+    fields = records[0].__slots__
+    if len(fields) == 1:
+        return [{fields[0]: getattr(r, fields[0])} for r in records]
+    get_values = attrgetter(*fields)
+    return [dict(zip(fields, get_values(r))) for r in records]
+
+
+class ChannelDetails(Record):
+    _fields = {
+        "Name": STRING,
+        "CycleID": INTEGER,
+        "ChannelID": INTEGER,
+        "Fluorophore": STRING,
+        "PassedQC": BOOLEAN,
+        "QCDetails": STRING,
+        "ExposureTimeMS": NUMBER,
+        "ExcitationWavelengthNM": INTEGER,
+        "EmissionWavelengthNM": INTEGER,
+        "Binning": INTEGER,
+        "Gain": NUMBER,
+    }
+    __slots__ = tuple(_fields)
+
+
+class StainChannel(Record):
+    _fields = {"CycleID": INTEGER, "ChannelID": INTEGER}
+    __slots__ = tuple(_fields)
+
+
+class SegmentationMetadata(Record):
+    _fields = {
+        "NuclearStainForSegmentation": RECORD,
+        "MembraneStainForSegmentation": RECORD,
+    }
+    __slots__ = tuple(_fields)
+
+
+class Missing2Metadata(Record):
+    _fields = {
+        "Version": STRING,
+        "AcquisitionDate": STRING,
+        "AssayType": STRING,
+        "AssaySpecificSoftware": STRING,
+        "AcquisitionMode": STRING,
+        "DatasetName": STRING,
+        "Microscope": STRING,
+    }
+    __slots__ = tuple(_fields)
+
+
+class ExperimentMetadata(Record):
+    _fields = {
+        "ImmersionMedium": STRING,
+        "NominalMagnification": NUMBER,
+        "NumericalAperture": NUMBER,
+        "ResolutionX": NUMBER,
+        "ResolutionXUnit": STRING,
+        "ResolutionY": NUMBER,
+        "ResolutionYUnit": STRING,
+        "ResolutionZ": NUMBER,
+        "ResolutionZUnit": STRING,
+        "BitDepth": INTEGER,
+        "NumRegions": INTEGER,
+        "NumCycles": INTEGER,
+        "NumZPlanes": INTEGER,
+        "NumChannels": INTEGER,
+        "RegionWidth": INTEGER,
+        "RegionHeight": INTEGER,
+        "TileWidth": INTEGER,
+        "TileHeight": INTEGER,
+        "TileOverlapX": NUMBER,
+        "TileOverlapY": NUMBER,
+        "TileLayout": STRING,
+    }
+    __slots__ = tuple(_fields)
@@ -0,0 +1,137 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Union
+
+from io_limits import limit_file_read, limit_read
+from json_codec import read_json_file
+
+SCHEDULES = ("input", "largest-first", "smallest-first")
+PROBE_THREADS = 16
+# image files stat'ed in the first image directory to estimate the image size
+SAMPLED_IMAGES = 8
+
+# Coefficients of the cost model, in seconds. The journal records estimated
+# and actual time of every dataset, so they can be checked against real batches.
+SECONDS_PER_DATASET = 0.5
+SECONDS_PER_DIR = 0.005
+SECONDS_PER_IMAGE = 0.00002
+# whole images are read to get their embedded headers
+READ_BYTES_PER_SECOND = 200 * 1024**2
+
+
+class DatasetCost(NamedTuple):
+    img_dirs: int
+    images: int
+    header_bytes: int
+    seconds: float
+
+
+def estimate_num_images(exp_metadata: dict) -> int:
+    """Cycles * regions * channels * tiles * z-planes from experiment.json"""
+    num_images = 1
+    for key in (
+        "numCycles",
+        "numRegions",
+        "numChannels",
+        "regionWidth",
+        "regionHeight",
+        "numZPlanes",
+    ):
+        num_images *= int(exp_metadata[key])
+    return num_images
+
+
+def sample_image_size(img_dir: Path) -> int:
+    """Average size of the first few images in the directory"""
+    sizes = []
+    with limit_read(None), os.scandir(img_dir) as it:
+        for entry in it:
+            if entry.name.endswith((".tif", ".tiff")):
+                sizes.append(entry.stat().st_size)
+                if len(sizes) >= SAMPLED_IMAGES:
+                    break
+    if sizes == []:
+        return 0
+    return sum(sizes) // len(sizes)
+
+
+def estimate_dataset_cost(dataset_path: Path) -> DatasetCost:
+    """Estimates conversion time from a scan of the dataset directory,
+    experiment.json and sizes of a few images. Conversion lists every
+    image directory and reads one image per cycle and channel.
+    """
+    from dataset_probe import probe_dataset
+
+    inventory = probe_dataset(dataset_path)
+    img_dirs = inventory.get_img_dirs()
+    exp_metadata_path = inventory.get_experiment_json_path()
+    with limit_file_read(exp_metadata_path):
+        exp_metadata = read_json_file(exp_metadata_path)
+    num_images = estimate_num_images(exp_metadata)
+    num_headers = int(exp_metadata["numCycles"]) * int(exp_metadata["numChannels"])
+    header_bytes = num_headers * sample_image_size(img_dirs[0])
+    seconds = (
+        SECONDS_PER_DATASET
+        + len(img_dirs) * SECONDS_PER_DIR
+        + num_images * SECONDS_PER_IMAGE
+        + header_bytes / READ_BYTES_PER_SECOND
+    )
+    return DatasetCost(len(img_dirs), num_images, header_bytes, seconds)
+
+
+def try_estimate_dataset_cost(dataset_path: Path) -> Union[None, DatasetCost]:
+    # the dataset will fail with the same error during conversion and be reported
+    try:
+        return estimate_dataset_cost(dataset_path)
+    except Exception:
+        return None
+
+
+def estimate_costs(
+    input_dirs: List[Path], num_threads: int = PROBE_THREADS
+) -> Dict[Path, Union[None, DatasetCost]]:
+    """Probes the datasets in parallel threads, returns None for
+    the datasets that could not be probed
+    """
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        costs = executor.map(try_estimate_dataset_cost, input_dirs)
+        return dict(zip(input_dirs, costs))
+
+
+def get_seconds(cost: Union[None, DatasetCost]) -> float:
+    # datasets that could not be probed fail early in conversion
+    return 0.0 if cost is None else cost.seconds
+
+
+def order_datasets(
+    input_output_map: Dict[Path, Path],
+    costs: Dict[Path, Union[None, DatasetCost]],
+    schedule: str,
+) -> Dict[Path, Path]:
+    """Largest first packs the datasets into the parallel processes
+    so that none is left with a long dataset at the end,
+    smallest first gives the most converted datasets early
+    """
+    if schedule == "input":
+        return input_output_map
+    if schedule not in SCHEDULES:
+        msg = f"Unknown schedule {schedule}, expected one of {list(SCHEDULES)}"
+        raise ValueError(msg)
+    ordered = sorted(
+        input_output_map.items(),
+        key=lambda item: get_seconds(costs[item[0]]),
+        reverse=schedule == "largest-first",
+    )
+    return dict(ordered)
+
+
+def estimate_makespan(seconds: List[float], jobs: int) -> float:
+    """Time to convert the datasets in this order when each of the jobs
+    processes takes the next dataset as soon as it is free
+    """
+    finish_times = [0.0] * max(jobs, 1)
+    for s in seconds:
+        heapq.heapreplace(finish_times, finish_times[0] + s)
+    return max(finish_times)
@@ -0,0 +1,363 @@
+import re
+from typing import Any, Dict, List, Tuple
+
+# draft-07 keywords not used by our schemas, a schema with any of them is rejected
+# instead of silently skipping the check. Other unknown keywords are ignored,
+# same as jsonschema does.
+UNSUPPORTED_KEYWORDS = {
+    "$ref",
+    "definitions",
+    "oneOf",
+    "not",
+    "if",
+    "then",
+    "else",
+    "contains",
+    "propertyNames",
+    "patternProperties",
+    "dependencies",
+    "minProperties",
+    "maxProperties",
+}
+
+TYPE_CHECKS = {
+    "string": "isinstance({v}, str)",
+    "object": "isinstance({v}, dict)",
+    "array": "isinstance({v}, list)",
+    "boolean": "isinstance({v}, bool)",
+    "null": "{v} is None",
+    "number": "(isinstance({v}, (int, float)) and not isinstance({v}, bool))",
+    "integer": "(isinstance({v}, int) and not isinstance({v}, bool)"
+    + " or isinstance({v}, float) and {v}.is_integer())",
+}
+IS_NUMBER = TYPE_CHECKS["number"]
+
+
+class FastValidationError(Exception):
+    """Raised by the generated validators on the first failed check.
+    path is the path to the invalid value, same as absolute_path of
+    jsonschema.ValidationError
+    """
+
+    def __init__(self, message: str, path: List[Any]):
+        super().__init__(message)
+        self.message = message
+        self.path = path
+
+
+def to_hashable(value: Any) -> Any:
+    """Converts json value to a hashable one that compares the same way
+    as jsonschema compares values for enum and uniqueItems:
+    true is not equal to 1, and 1.0 is equal to 1
+    """
+    if isinstance(value, bool):
+        return ("boolean", value)
+    elif isinstance(value, dict):
+        return ("object", frozenset((k, to_hashable(v)) for k, v in value.items()))
+    elif isinstance(value, list):
+        return ("array", tuple(to_hashable(v) for v in value))
+    return value
+
+
+def has_unique_items(values: List[Any]) -> bool:
+    try:
+        return len(set(to_hashable(v) for v in values)) == len(values)
+    except TypeError:
+        # values that are not json types, compared pairwise
+        hashable = [to_hashable(v) for v in values]
+        return all(
+            hashable[i] != hashable[j]
+            for i in range(len(hashable))
+            for j in range(i + 1, len(hashable))
+        )
+
+
+def is_valid(validate_func, instance: Any) -> bool:
+    try:
+        validate_func(instance)
+    except FastValidationError:
+        return False
+    return True
+
+
+class ValidatorCodeGenerator:
+    """Compiles a json schema into the source of python functions
+    with all checks inlined, in the style of fastjsonschema.
+    Checks are done in a single pass over the instance and the first failed one
+    raises FastValidationError.
+    """
+
+    def __init__(self, func_name: str):
+        self.func_name = func_name
+        self.functions: List[List[str]] = []
+        self.constants: Dict[str, Any] = dict()
+        self.num_vars = 0
+
+    def generate(self, schema: Any) -> str:
+        self.add_function(self.func_name, schema)
+        header = [f"{name} = {repr(value)}" for name, value in self.constants.items()]
+        funcs = ["\n".join(lines) for lines in reversed(self.functions)]
+        return "\n".join(header) + "\n\n\n" + "\n\n\n".join(funcs) + "\n"
+
+    def add_function(self, func_name: str, schema: Any):
+        lines = [f"def {func_name}(data):"]
+        self.functions.append(lines)
+        body = []
+        self.emit(schema, "data", [], body, 1)
+        lines.extend(body or ["    pass"])
+
+    def new_var(self, prefix: str) -> str:
+        self.num_vars += 1
+        return f"{prefix}_{self.num_vars}"
+
+    def add_constant(self, prefix: str, value: Any) -> str:
+        name = f"{self.func_name.upper()}_{prefix}_{len(self.constants)}"
+        self.constants[name] = value
+        return name
+
+    def emit(self, schema: Any, var: str, path: List[str], out: List[str], ind: int):
+        """Appends to out the statements checking the value in var against schema.
+        path is the list of python expressions of the path to the value.
+        """
+        pad = "    " * ind
+        path_expr = "[" + ", ".join(path) + "]"
+
+        def fail(msg_expr: str, level: int = ind):
+            out.append(
+                "    " * level + f"raise FastValidationError({msg_expr}, {path_expr})"
+            )
+
+        if schema is True or schema == {}:
+            return
+        if schema is False:
+            out.append(pad + "if True:")
+            fail(f'f"False schema does not allow {{{var}!r}}"', ind + 1)
+            return
+        for keyword in schema:
+            if keyword in UNSUPPORTED_KEYWORDS:
+                msg = f"Keyword {keyword} is not supported by the validator generator"
+                raise NotImplementedError(msg)
+
+        if "type" in schema:
+            types = schema["type"]
+            types = [types] if isinstance(types, str) else types
+            check = " or ".join(TYPE_CHECKS[t].format(v=var) for t in types)
+            type_names = ", ".join(repr(t) for t in types)
+            out.append(pad + f"if not ({check}):")
+            fail(f'f"{{{var}!r}} is not of type {type_names}"', ind + 1)
+
+        if "enum" in schema:
+            name = self.add_constant("ENUM", schema["enum"])
+            hashable = self.add_constant(
+                "ENUM_SET", {to_hashable(v) for v in schema["enum"]}
+            )
+            out.append(pad + f"if to_hashable({var}) not in {hashable}:")
+            fail(f'f"{{{var}!r}} is not one of {{{name}!r}}"', ind + 1)
+
+        if "const" in schema:
+            name = self.add_constant("CONST", schema["const"])
+            out.append(pad + f"if to_hashable({var}) != to_hashable({name}):")
+            fail(f'f"{{{name}!r}} was expected"', ind + 1)
+
+        self.emit_number(schema, var, out, ind, fail)
+        self.emit_string(schema, var, out, ind, fail)
+        self.emit_array(schema, var, path, out, ind, fail)
+        self.emit_object(schema, var, path, out, ind, fail)
+
+        for subschema in schema.get("allOf", []):
+            self.emit(subschema, var, path, out, ind)
+
+        if "anyOf" in schema:
+            funcs = []
+            for subschema in schema["anyOf"]:
+                func_name = self.new_var(f"{self.func_name}_any_of")
+                self.add_function(func_name, subschema)
+                funcs.append(func_name)
+            funcs_expr = "(" + ", ".join(funcs) + ",)"
+            out.append(pad + f"if not any(is_valid(f, {var}) for f in {funcs_expr}):")
+            fail(f'f"{{{var}!r}} is not valid under any of the given schemas"', ind + 1)
+
+    def emit_number(self, schema: dict, var: str, out: List[str], ind: int, fail):
+        checks = {
+            "minimum": ("<", "is less than the minimum of"),
+            "maximum": (">", "is greater than the maximum of"),
+            "exclusiveMinimum": ("<=", "is less than or equal to the minimum of"),
+            "exclusiveMaximum": (">=", "is greater than or equal to the maximum of"),
+        }
+        keywords = [k for k in list(checks) + ["multipleOf"] if k in schema]
+        if not keywords:
+            return
+        pad = "    " * (ind + 1)
+        out.append("    " * ind + f"if {IS_NUMBER.format(v=var)}:")
+        for keyword in keywords:
+            limit = schema[keyword]
+            if keyword == "multipleOf":
+                # same as jsonschema, float divisor is checked via the quotient
+                if isinstance(limit, float):
+                    cond = f"int({var} / {limit!r}) != {var} / {limit!r}"
+                else:
+                    cond = f"{var} % {limit!r}"
+                out.append(pad + f"if {cond}:")
+                fail(f'f"{{{var}!r}} is not a multiple of {limit}"', ind + 2)
+            else:
+                op, text = checks[keyword]
+                out.append(pad + f"if {var} {op} {limit!r}:")
+                fail(f'f"{{{var}!r}} {text} {limit!r}"', ind + 2)
+
+    def emit_string(self, schema: dict, var: str, out: List[str], ind: int, fail):
+        keywords = [k for k in ("minLength", "maxLength", "pattern") if k in schema]
+        if not keywords:
+            return
+        pad = "    " * (ind + 1)
+        out.append("    " * ind + f"if isinstance({var}, str):")
+        if "minLength" in schema:
+            out.append(pad + f"if len({var}) < {schema['minLength']!r}:")
+            fail(f'f"{{{var}!r}} is too short"', ind + 2)
+        if "maxLength" in schema:
+            out.append(pad + f"if len({var}) > {schema['maxLength']!r}:")
+            fail(f'f"{{{var}!r}} is too long"', ind + 2)
+        if "pattern" in schema:
+            pattern = schema["pattern"]
+            name = self.add_constant("PATTERN", pattern)
+            compiled = self.add_constant("REGEX", None)
+            self.constants[compiled] = re.compile(pattern)
+            out.append(pad + f"if not {compiled}.search({var}):")
+            fail(f'f"{{{var}!r}} does not match {{{name}!r}}"', ind + 2)
+
+    def emit_array(
+        self, schema: dict, var: str, path: List[str], out: List[str], ind: int, fail
+    ):
+        keywords = ("items", "additionalItems", "minItems", "maxItems", "uniqueItems")
+        if not any(k in schema for k in keywords):
+            return
+        pad = "    " * (ind + 1)
+        out.append("    " * ind + f"if isinstance({var}, list):")
+        if "minItems" in schema:
+            out.append(pad + f"if len({var}) < {schema['minItems']!r}:")
+            fail(f'f"{{{var}!r}} is too short"', ind + 2)
+        if "maxItems" in schema:
+            out.append(pad + f"if len({var}) > {schema['maxItems']!r}:")
+            fail(f'f"{{{var}!r}} is too long"', ind + 2)
+        if schema.get("uniqueItems", False):
+            out.append(pad + f"if not has_unique_items({var}):")
+            fail(f'f"{{{var}!r}} has non-unique elements"', ind + 2)
+
+        items = schema.get("items", True)
+        if isinstance(items, list):
+            for i, item_schema in enumerate(items):
+                item_var = self.new_var("item")
+                out.append(pad + f"if len({var}) > {i}:")
+                out.append(pad + f"    {item_var} = {var}[{i}]")
+                self.emit(item_schema, item_var, path + [str(i)], out, ind + 2)
+            additional = schema.get("additionalItems", True)
+            if additional is False:
+                out.append(pad + f"if len({var}) > {len(items)}:")
+                fail(
+                    '"Additional items are not allowed '
+                    + f'({{}} were unexpected)".format({var}[{len(items)}:])',
+                    ind + 2,
+                )
+            elif additional is not True and additional != {}:
+                self.emit_items_loop(additional, var, len(items), path, out, ind + 1)
+        elif items is not True and items != {}:
+            # additionalItems is ignored when items is a single schema
+            self.emit_items_loop(items, var, 0, path, out, ind + 1)
+
+    def emit_items_loop(
+        self, schema: Any, var: str, start: int, path: List[str], out, ind: int
+    ):
+        index_var = self.new_var("index")
+        item_var = self.new_var("item")
+        items_expr = var if start == 0 else f"{var}[{start}:]"
+        out.append(
+            "    " * ind + f"for {index_var}, {item_var} in "
+            f"enumerate({items_expr}, {start}):"
+        )
+        body = []
+        self.emit(schema, item_var, path + [index_var], body, ind + 1)
+        out.extend(body or ["    " * (ind + 1) + "pass"])
+
+    def emit_object(
+        self, schema: dict, var: str, path: List[str], out: List[str], ind: int, fail
+    ):
+        keywords = ("required", "properties", "additionalProperties")
+        if not any(k in schema for k in keywords):
+            return
+        pad = "    " * (ind + 1)
+        out.append("    " * ind + f"if isinstance({var}, dict):")
+        for prop in schema.get("required", []):
+            out.append(pad + f"if {prop!r} not in {var}:")
+            fail(f'"{prop!r} is a required property"', ind + 2)
+
+        properties = schema.get("properties", dict())
+        for prop, prop_schema in properties.items():
+            if prop_schema is True or prop_schema == {}:
+                continue
+            prop_var = self.new_var("prop")
+            out.append(pad + f"if {prop!r} in {var}:")
+            out.append(pad + f"    {prop_var} = {var}[{prop!r}]")
+            self.emit(prop_schema, prop_var, path + [repr(prop)], out, ind + 2)
+
+        additional = schema.get("additionalProperties", True)
+        if additional is True or additional == {}:
+            return
+        known = self.add_constant("PROPERTIES", set(properties))
+        if additional is False:
+            extra_var = self.new_var("extra")
+            out.append(pad + f"{extra_var} = [p for p in {var} if p not in {known}]")
+            out.append(pad + f"if {extra_var}:")
+            fail(
+                '"Additional properties are not allowed ({} {} unexpected)".format('
+                + f'", ".join(repr(p) for p in {extra_var}), '
+                + f'"was" if len({extra_var}) == 1 else "were")',
+                ind + 2,
+            )
+        else:
+            key_var = self.new_var("key")
+            out.append(pad + f"for {key_var} in {var}:")
+            out.append(pad + f"    if {key_var} not in {known}:")
+            value_var = self.new_var("value")
+            out.append(pad + f"        {value_var} = {var}[{key_var}]")
+            body = []
+            self.emit(additional, value_var, path + [key_var], body, ind + 3)
+            out.extend(body or [pad + "        pass"])
+
+
+def generate_validator_source(func_name: str, schema: Any) -> str:
+    """Returns the source of function func_name(data) that raises
+    FastValidationError if data is not valid against the schema
+    """
+    return ValidatorCodeGenerator(func_name).generate(schema)
+
+
+def generate_module_source(schemas: Dict[str, Any]) -> Tuple[str, Dict[str, str]]:
+    """Returns (source of the module with validators of all schemas,
+    {schema name: function name})
+    """
+    func_names = {
+        name: "validate_" + re.sub(r"\W", "_", name) for name in schemas.keys()
+    }
+    lines = [
+        "import re",
+        "",
+        "from schema_codegen import FastValidationError, has_unique_items, "
+        + "is_valid, to_hashable",
+        "",
+    ]
+    for name, schema in schemas.items():
+        lines.append(generate_validator_source(func_names[name], schema))
+    return "\n".join(lines), func_names
+
+
+def compile_validator(func_name: str, schema: Any):
+    """Generates validator of the schema and compiles it in place"""
+    source = generate_validator_source(func_name, schema)
+    namespace = {
+        "re": re,
+        "FastValidationError": FastValidationError,
+        "has_unique_items": has_unique_items,
+        "is_valid": is_valid,
+        "to_hashable": to_hashable,
+    }
+    exec(compile(source, f"<{func_name}>", "exec"), namespace)
+    return namespace[func_name]
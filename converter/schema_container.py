@@ -1,6 +1,13 @@
+import hashlib
 import json
+from pathlib import Path
+from typing import Any, Callable, Dict, List
 
-from packaging import version
+from schema_codegen import (
+    FastValidationError,
+    compile_validator,
+    generate_module_source,
+)
 
 _dataset_schema_str = """{
     "$schema": "http://json-schema.org/draft-07/schema",
@@ -2009,23 +2016,226 @@ _experiment_1_5_schema_str = """{
 """
 
 
-dataset_schema = json.loads(_dataset_schema_str)
-experiment_1_7_schema = json.loads(_experiment_1_7_schema_str)
-experiment_1_5_schema = json.loads(_experiment_1_5_schema_str)
+_schema_strs = {
+    "dataset": _dataset_schema_str,
+    "experiment_1.7": _experiment_1_7_schema_str,
+    "experiment_1.5": _experiment_1_5_schema_str,
+}
+# module attributes that used to be parsed at import time
+_schema_attrs = {
+    "dataset_schema": "dataset",
+    "experiment_1_7_schema": "experiment_1.7",
+    "experiment_1_5_schema": "experiment_1.5",
+}
+PREBUILT_MODULE_NAME = "schema_prebuilt"
 
+# Schemas are parsed on first use. If schema_prebuilt.py generated by
+# running this file is present, and was built from the same schema strings,
+# schemas are taken from it and json parsing is skipped altogether.
+_schemas = dict()
+_prebuilt_schemas = None
+
+
+def get_schemas_hash() -> str:
+    h = hashlib.sha256()
+    for name, schema_str in _schema_strs.items():
+        h.update(name.encode("utf-8"))
+        h.update(schema_str.encode("utf-8"))
+    return h.hexdigest()
+
+
+def import_prebuilt_module():
+    """Returns schema_prebuilt if it is present and was built from the same
+    schema strings, otherwise None. The import is written out, not made from
+    PREBUILT_MODULE_NAME, so that pyinstaller finds and bundles the module.
+    """
+    try:
+        import schema_prebuilt
+    except ImportError:
+        return None
+    if getattr(schema_prebuilt, "SCHEMAS_HASH", None) != get_schemas_hash():
+        return None
+    return schema_prebuilt
+
+
+def load_prebuilt_schemas() -> Dict[str, dict]:
+    prebuilt = import_prebuilt_module()
+    if prebuilt is None:
+        return dict()
+    return prebuilt.SCHEMAS
+
+
+def load_schema(schema_name: str) -> dict:
+    global _prebuilt_schemas
+    if schema_name not in _schemas:
+        if _prebuilt_schemas is None:
+            _prebuilt_schemas = load_prebuilt_schemas()
+        if schema_name in _prebuilt_schemas:
+            _schemas[schema_name] = _prebuilt_schemas[schema_name]
+        else:
+            _schemas[schema_name] = json.loads(_schema_strs[schema_name])
+    return _schemas[schema_name]
+
+
+def __getattr__(name: str):
+    if name in _schema_attrs:
+        return load_schema(_schema_attrs[name])
+    msg = f"module {__name__} has no attribute {name}"
+    raise AttributeError(msg)
+
+
+def load_prebuilt_validators() -> Dict[str, Callable]:
+    prebuilt = import_prebuilt_module()
+    if prebuilt is None:
+        return dict()
+    return getattr(prebuilt, "VALIDATORS", dict())
+
+
+def build_prebuilt_schemas(out_path: Path):
+    """Writes parsed schemas as python literals, when the module is imported
+    they are loaded from the compiled bytecode without json parsing.
+    Generated validators of the schemas are written to the same module.
+    """
+    schemas = {name: json.loads(s) for name, s in _schema_strs.items()}
+    validators_source, func_names = generate_module_source(schemas)
+    validators = ", ".join(f"{repr(n)}: {f}" for n, f in func_names.items())
+    with open(out_path, "w", encoding="utf-8") as s:
+        s.write("# Generated by schema_container.py, do not edit\n")
+        s.write(validators_source)
+        s.write(f"\n\nSCHEMAS_HASH = {repr(get_schemas_hash())}\n")
+        s.write(f"SCHEMAS = {repr(schemas)}\n")
+        s.write(f"VALIDATORS = {{{validators}}}\n")
+
+
+def get_experiment_metadata_version(metadata: dict) -> str:
+    """Returns the version of the experiment.json schema: 1.7 or 1.5"""
+    from packaging import version
 
-def get_experiment_metadata_schema(metadata: dict):
     ver = metadata.get("version", None)
     if ver is None:
         msg = "Could not find field version in the experiment.json metadata"
         raise ValueError(msg)
     if version.parse(ver) >= version.parse("1.7") < version.parse("1.8"):
-        return experiment_1_7_schema
+        return "1.7"
     elif version.parse(ver) >= version.parse("1.5") < version.parse("1.7"):
-        return experiment_1_5_schema
+        return "1.5"
     else:
         msg = (
             f"The version {str(ver)} of experiment.json is not supported."
             + "Supported version are 1.5 and 1.7"
         )
         raise NotImplementedError(msg)
+
+
+def get_experiment_metadata_schema_name(metadata: dict) -> str:
+    return "experiment_" + get_experiment_metadata_version(metadata)
+
+
+def get_document_schema_name(instance: Any) -> str:
+    """experiment.json has field version, dataset.json has field Version"""
+    if isinstance(instance, dict) and "version" in instance:
+        return get_experiment_metadata_schema_name(instance)
+    return "dataset"
+
+
+def get_experiment_metadata_schema(metadata: dict):
+    return load_schema(get_experiment_metadata_schema_name(metadata))
+
+
+# Validators are built once per process, the schema is checked when
+# the validator is built and not on every validation as jsonschema.validate does
+_validators = dict()
+
+
+def get_validator(schema_name: str, schema: dict):
+    if schema_name not in _validators:
+        import jsonschema
+
+        validator_cls = jsonschema.validators.validator_for(schema)
+        validator_cls.check_schema(schema)
+        _validators[schema_name] = validator_cls(schema)
+    return _validators[schema_name]
+
+
+# Generated validators, see schema_codegen.py. They are taken from
+# schema_prebuilt.py if it is present, otherwise generated on first use.
+_fast_validators = dict()
+_prebuilt_validators = None
+
+
+def get_fast_validator(schema_name: str) -> Callable:
+    global _prebuilt_validators
+    if schema_name not in _fast_validators:
+        if _prebuilt_validators is None:
+            _prebuilt_validators = load_prebuilt_validators()
+        if schema_name in _prebuilt_validators:
+            _fast_validators[schema_name] = _prebuilt_validators[schema_name]
+        else:
+            func_name = "validate_" + schema_name.replace(".", "_")
+            schema = load_schema(schema_name)
+            _fast_validators[schema_name] = compile_validator(func_name, schema)
+    return _fast_validators[schema_name]
+
+
+class ValidatorMismatchError(RuntimeError):
+    """The generated validator and jsonschema disagree about a document,
+    which means a bug in schema_codegen.py
+    """
+
+
+def get_error_paths(errors) -> List[List[Any]]:
+    """absolute_path of the jsonschema errors and of the errors
+    of their anyOf and oneOf subschemas
+    """
+    paths = []
+    for error in errors:
+        paths.append(list(error.absolute_path))
+        paths.extend(get_error_paths(error.context))
+    return paths
+
+
+def check_validators_agree(
+    schema_name: str, fast_error: FastValidationError, errors: list
+):
+    """Raises ValidatorMismatchError if jsonschema found no errors
+    or none at the path reported by the generated validator
+    """
+    if errors != [] and fast_error.path in get_error_paths(errors):
+        return
+    msg = (
+        f"The generated validator of the schema {schema_name} reported"
+        + f" '{fast_error.message}' at {fast_error.path}, but jsonschema"
+    )
+    if errors == []:
+        msg += " found the document valid"
+    else:
+        paths = [list(e.absolute_path) for e in errors]
+        msg += f" reported errors only at {paths}"
+    raise ValidatorMismatchError(msg)
+
+
+def validate(instance: Any, schema_name: str):
+    """Raises the same error as jsonschema.validate.
+    The instance is checked with the generated validator, jsonschema is used
+    only for invalid instances, to find the best matching error.
+    ValidatorMismatchError is raised if jsonschema finds no error
+    at the path reported by the generated validator.
+    """
+    try:
+        get_fast_validator(schema_name)(instance)
+        return
+    except FastValidationError as e:
+        fast_error = e
+
+    import jsonschema
+
+    validator = get_validator(schema_name, load_schema(schema_name))
+    errors = list(validator.iter_errors(instance))
+    check_validators_agree(schema_name, fast_error, errors)
+    raise jsonschema.exceptions.best_match(errors)
+
+
+if __name__ == "__main__":
+    prebuilt_path = Path(__file__).with_name(PREBUILT_MODULE_NAME + ".py")
+    build_prebuilt_schemas(prebuilt_path)
+    print("Written", prebuilt_path)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import json
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Callable, List
+
+import jsonschema
+
+from schema_codegen import is_valid
+from schema_container import (
+    get_document_schema_name,
+    get_fast_validator,
+    get_validator,
+    load_schema,
+)
+
+converter_dir = Path(__file__).parent.absolute()
+default_paths = [
+    converter_dir / "examples" / "dataset_1.0.json",
+    converter_dir / "examples" / "experiment_1.5.json",
+    converter_dir / "examples" / "experiment_1.7.json",
+]
+
+
+def measure(func: Callable, num_runs: int) -> float:
+    """Returns the mean seconds per call"""
+    start = time.perf_counter()
+    for _ in range(num_runs):
+        func()
+    return (time.perf_counter() - start) / num_runs
+
+
+def benchmark_file(path: Path, num_runs: int) -> bool:
+    with open(path, "r", encoding="utf-8") as s:
+        instance = json.load(s)
+    schema_name = get_document_schema_name(instance)
+    schema = load_schema(schema_name)
+    validator = get_validator(schema_name, schema)
+    fast_validator = get_fast_validator(schema_name)
+
+    def run_jsonschema():
+        try:
+            jsonschema.validate(instance, schema)
+        except jsonschema.ValidationError:
+            pass
+
+    timings = {
+        "jsonschema.validate": measure(run_jsonschema, num_runs),
+        "cached validator": measure(lambda: validator.is_valid(instance), num_runs),
+        "generated validator": measure(
+            lambda: is_valid(fast_validator, instance), num_runs
+        ),
+    }
+
+    valid = validator.is_valid(instance)
+    agree = valid == is_valid(fast_validator, instance)
+    print(f"{path.name} ({schema_name}, {'valid' if valid else 'invalid'}):")
+    baseline = timings["jsonschema.validate"]
+    for name, seconds in timings.items():
+        speedup = baseline / seconds
+        print(f"    {name:20} {seconds * 1e6:10.1f} us  {speedup:6.1f}x")
+    if not agree:
+        print("    Generated validator disagrees with jsonschema")
+    return agree
+
+
+def main(paths: List[Path], num_runs: int) -> bool:
+    results = [benchmark_file(path, num_runs) for path in paths]
+    return all(results)
+
+
+if __name__ == "__main__":
+    p = ArgumentParser()
+    p.add_argument(
+        "paths",
+        type=Path,
+        nargs="*",
+        default=default_paths,
+        help="dataset.json or experiment.json files",
+    )
+    p.add_argument("--runs", type=int, default=200)
+    args = p.parse_args()
+
+    all_agree = main(args.paths, args.runs)
+    raise SystemExit(0 if all_agree else 1)
@@ -0,0 +1,188 @@
+import datetime
+import hashlib
+import math
+import os
+import socket
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Union
+
+from json_codec import dumps, loads
+
+MAX_CACHE_ENTRIES = 128
+SHARED_CACHE_DIR_NAME = "sidecar_cache"
+# The oldest entries of the shared cache are removed above this size
+MAX_SHARED_CACHE_BYTES = 64 * 1024**2
+# Part of the key of every entry, must be increased when a reader
+# or the format of the entries changes, so old entries are not used
+CACHE_FORMAT_VERSION = 2
+
+# Parsed sidecar files keyed by (format version, reader, file format, content hash,
+# reader parameters). Datasets of one batch often share byte-identical missing1
+# and missing2 files, so each unique file is parsed once. Cached values are shared
+# between datasets and must not be modified by the callers.
+_cache = OrderedDict()
+_max_entries = MAX_CACHE_ENTRIES
+_shared_cache_dir = None
+
+
+def configure_cache(
+    max_entries: int = MAX_CACHE_ENTRIES, shared_cache_dir: Union[None, Path] = None
+):
+    """shared_cache_dir, if provided, is used to share parsed files
+    between worker processes, including the workers on other hosts.
+    """
+    global _max_entries, _shared_cache_dir
+    _max_entries = max_entries
+    _shared_cache_dir = shared_cache_dir
+    if shared_cache_dir is not None:
+        shared_cache_dir.mkdir(parents=True, exist_ok=True)
+    while len(_cache) > _max_entries:
+        _cache.popitem(last=False)
+
+
+def get_shared_cache_dir(workdir: Path) -> Path:
+    return workdir / SHARED_CACHE_DIR_NAME
+
+
+def encode_value(value: Any) -> Any:
+    """Converts a parsed sidecar to plain JSON data, the shared cache is
+    a directory other hosts can write to, so it never stores pickles.
+    Raises TypeError for values that cannot be stored.
+    """
+    if isinstance(value, float) and not math.isfinite(value):
+        # json backends write NaN as null or reject it
+        return {"float": repr(value)}
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    elif isinstance(value, dict):
+        if not all(isinstance(k, str) for k in value.keys()):
+            raise TypeError("Only dicts with str keys can be cached")
+        return {"dict": {k: encode_value(v) for k, v in value.items()}}
+    elif isinstance(value, (list, tuple)):
+        return {type(value).__name__: [encode_value(v) for v in value]}
+    elif isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    elif isinstance(value, datetime.date):
+        return {"date": value.isoformat()}
+    elif isinstance(value, datetime.time):
+        return {"time": value.isoformat()}
+    elif type(value).__name__ == "ndarray" and value.dtype.kind in "biufU":
+        return {"ndarray": value.tolist(), "dtype": value.dtype.str}
+    raise TypeError(f"Values of type {type(value).__name__} cannot be cached")
+
+
+def decode_value(encoded: Any) -> Any:
+    if not isinstance(encoded, dict):
+        return encoded
+    elif "float" in encoded:
+        return float(encoded["float"])
+    elif "dict" in encoded:
+        return {k: decode_value(v) for k, v in encoded["dict"].items()}
+    elif "list" in encoded:
+        return [decode_value(v) for v in encoded["list"]]
+    elif "tuple" in encoded:
+        return tuple(decode_value(v) for v in encoded["tuple"])
+    elif "datetime" in encoded:
+        return datetime.datetime.fromisoformat(encoded["datetime"])
+    elif "date" in encoded:
+        return datetime.date.fromisoformat(encoded["date"])
+    elif "time" in encoded:
+        return datetime.time.fromisoformat(encoded["time"])
+    elif "ndarray" in encoded:
+        import numpy as np
+
+        return np.array(encoded["ndarray"], dtype=encoded["dtype"])
+    raise ValueError("Unknown type of a cache entry")
+
+
+def read_from_shared_cache(key_hash: str) -> Any:
+    cache_path = _shared_cache_dir / (key_hash + ".json")
+    try:
+        with open(cache_path, "rb") as s:
+            entry = loads(s.read())
+        return decode_value(entry["value"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def write_to_shared_cache(key_hash: str, key: tuple, value: Any):
+    # written to a temporary file and renamed, so other workers
+    # never read a partially written entry
+    try:
+        entry = {"key": repr(key), "value": encode_value(value)}
+    except TypeError:
+        return
+    cache_path = _shared_cache_dir / (key_hash + ".json")
+    # workers on different hosts can have the same pid
+    tmp_name = cache_path.name + f".tmp{socket.gethostname()}-{os.getpid()}"
+    tmp_path = cache_path.with_name(tmp_name)
+    # the file is parsed again if the entry cannot be written,
+    # e.g. the share is full or read only
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as s:
+            s.write(dumps(entry))
+        os.replace(tmp_path, cache_path)
+        prune_shared_cache()
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def prune_shared_cache(max_bytes: int = MAX_SHARED_CACHE_BYTES):
+    """Removes the oldest entries until the directory is below max_bytes,
+    including the entries of previous format versions
+    """
+    entries = []
+    with os.scandir(_shared_cache_dir) as it:
+        for entry in it:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            # removed by another worker
+            pass
+        total_bytes -= size
+
+
+def cached_read(reader: Callable, file_path: Path, *params) -> Any:
+    """Returns reader(file_path, *params, data=content of the file), parsing the file
+    only if a file with the same content was not read with the same parameters before.
+    The file is read once, its content is hashed and parsed. Errors are not cached.
+    """
+    with open(file_path, "rb") as s:
+        data = s.read()
+    key = (
+        CACHE_FORMAT_VERSION,
+        reader.__name__,
+        file_path.suffix.lower(),
+        hashlib.sha256(data).hexdigest(),
+        params,
+    )
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    value = None
+    if _shared_cache_dir is not None:
+        key_hash = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        value = read_from_shared_cache(key_hash)
+    if value is None:
+        value = reader(file_path, *params, data=data)
+        if _shared_cache_dir is not None:
+            write_to_shared_cache(key_hash, key, value)
+
+    _cache[key] = value
+    if len(_cache) > _max_entries:
+        _cache.popitem(last=False)
+    return value
@@ -0,0 +1,164 @@
+import time
+import traceback
+from multiprocessing import get_context
+from multiprocessing.connection import wait
+from typing import Any, Callable, Hashable, List, Tuple, Union
+
+# seconds to wait for a worker that was asked to stop before it is killed
+STOP_TIMEOUT = 5.0
+
+# Outcomes of the tasks
+DONE = "done"
+ERROR = "error"
+KILLED = "killed"
+DIED = "died"
+
+
+def run_worker_process(conn, initializer: Union[None, Callable], initargs: tuple):
+    """Runs the tasks received from the pool until it sends None"""
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        func, args = task
+        try:
+            result = (DONE, func(*args))
+        except Exception:
+            result = (ERROR, traceback.format_exc())
+        conn.send(result)
+
+
+class Worker:
+    def __init__(self, context, initializer: Union[None, Callable], initargs: tuple):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=run_worker_process,
+            args=(child_conn, initializer, initargs),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        # key of the running task, when it was started and its deadline
+        self.key = None
+        self.started = 0.0
+        self.deadline = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SupervisedPool:
+    """Process pool in which every task has a hard deadline. A worker that
+    exceeds it, e.g. hung in a read from a network share, is killed and
+    replaced by a new worker, the tasks of the other workers continue.
+    Each worker has its own pipe, so killing it cannot break the others.
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        task_timeout: Union[None, float] = None,
+        initializer: Union[None, Callable] = None,
+        initargs: tuple = (),
+    ):
+        self.context = get_context()
+        self.task_timeout = task_timeout
+        self.initializer = initializer
+        self.initargs = initargs
+        self.idle = [self.start_worker() for _ in range(max(num_workers, 1))]
+        # {pipe: worker} of the workers running a task
+        self.busy = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def start_worker(self) -> Worker:
+        return Worker(self.context, self.initializer, self.initargs)
+
+    def num_idle(self) -> int:
+        return len(self.idle)
+
+    def num_running(self) -> int:
+        return len(self.busy)
+
+    def submit(self, key: Hashable, func: Callable, *args):
+        """Starts the task in an idle worker, there must be one"""
+        worker = self.idle.pop()
+        worker.key = key
+        worker.started = time.monotonic()
+        worker.deadline = None
+        if self.task_timeout is not None:
+            worker.deadline = worker.started + self.task_timeout
+        worker.conn.send((func, args))
+        self.busy[worker.conn] = worker
+
+    def replace_worker(self, worker: Worker):
+        del self.busy[worker.conn]
+        worker.kill()
+        self.idle.append(self.start_worker())
+
+    def wait(self) -> List[Tuple[Hashable, str, Any, float]]:
+        """Waits until at least one task finishes or is killed,
+        returns [(key, outcome, result or error message, seconds)]
+        """
+        finished = []
+        while finished == [] and self.busy:
+            deadlines = [w.deadline for w in self.busy.values() if w.deadline]
+            timeout = None
+            if deadlines:
+                timeout = max(min(deadlines) - time.monotonic(), 0)
+            for conn in wait(list(self.busy.keys()), timeout):
+                worker = self.busy[conn]
+                seconds = time.monotonic() - worker.started
+                try:
+                    outcome, result = conn.recv()
+                except (EOFError, OSError):
+                    worker.process.join(STOP_TIMEOUT)
+                    msg = (
+                        "Worker process exited unexpectedly"
+                        + f" with code {worker.process.exitcode}"
+                    )
+                    finished.append((worker.key, DIED, msg, seconds))
+                    self.replace_worker(worker)
+                    continue
+                finished.append((worker.key, outcome, result, seconds))
+                del self.busy[conn]
+                self.idle.append(worker)
+
+            now = time.monotonic()
+            for worker in list(self.busy.values()):
+                if worker.deadline is not None and now >= worker.deadline:
+                    msg = (
+                        f"Did not finish in {self.task_timeout:g} seconds,"
+                        + " the worker process was killed"
+                    )
+                    finished.append((worker.key, KILLED, msg, now - worker.started))
+                    self.replace_worker(worker)
+        return finished
+
+    def shutdown(self):
+        for worker in self.idle:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in self.idle:
+            worker.process.join(STOP_TIMEOUT)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            worker.conn.close()
+        for worker in list(self.busy.values()):
+            worker.kill()
+        self.idle = []
+        self.busy = dict()
@@ -0,0 +1,82 @@
+import csv
+import io
+from itertools import islice
+from pathlib import Path
+from typing import Any, List, Tuple, Union
+
+from json_codec import loads, read_json_file
+from xlsx_reader import normalize_rows, read_xlsx_rows
+
+TEXT_DELIMITERS = {".csv": ",", ".tsv": "\t"}
+
+
+def read_delimited_rows(
+    table_path: Path,
+    delimiter: str,
+    max_rows: Union[None, int] = None,
+    max_cols: Union[None, int] = None,
+    data: Union[None, bytes] = None,
+) -> List[Tuple[Any, ...]]:
+    # utf-8-sig strips the byte order mark that Excel puts into exported csv files
+    if data is None:
+        s = open(table_path, "r", encoding="utf-8-sig", newline="")
+    else:
+        s = io.StringIO(data.decode("utf-8-sig"), newline="")
+    with s:
+        reader = csv.reader(s, delimiter=delimiter)
+        rows = [tuple(row[:max_cols]) for row in islice(reader, max_rows)]
+    return rows
+
+
+def read_json_rows(
+    table_path: Path,
+    max_rows: Union[None, int] = None,
+    max_cols: Union[None, int] = None,
+    data: Union[None, bytes] = None,
+) -> List[Tuple[Any, ...]]:
+    """Supports a list of records [{"Marker": "DAPI", ...}, ...],
+    where the keys of the records become the header row,
+    and a single record {"Version": "1.0", ...}, where each key becomes a row.
+    """
+    table = read_json_file(table_path) if data is None else loads(data)
+    if isinstance(table, dict):
+        rows = [(k, v) for k, v in table.items()]
+    elif isinstance(table, list) and all(isinstance(r, dict) for r in table):
+        header = []
+        for record in table:
+            header.extend(k for k in record.keys() if k not in header)
+        rows = [tuple(header)]
+        rows.extend(tuple(record.get(k) for k in header) for record in table)
+    else:
+        msg = (
+            f"Unexpected structure of the file {table_path.name}. "
+            + "Expected a list of records or a single record."
+        )
+        raise ValueError(msg)
+    rows = [row[:max_cols] for row in rows[:max_rows]]
+    return rows
+
+
+def read_table_rows(
+    table_path: Path,
+    max_rows: Union[None, int] = None,
+    max_cols: Union[None, int] = None,
+    data: Union[None, bytes] = None,
+) -> List[Tuple[Any, ...]]:
+    """Returns rows of xlsx, csv, tsv or json table in the same form as read_xlsx_rows.
+    data, if provided, is the content of the file that was already read.
+    """
+    suffix = table_path.suffix.lower()
+    if suffix == ".xlsx":
+        return read_xlsx_rows(table_path, max_rows, max_cols, data)
+    elif suffix in TEXT_DELIMITERS:
+        rows = read_delimited_rows(
+            table_path, TEXT_DELIMITERS[suffix], max_rows, max_cols, data
+        )
+    elif suffix == ".json":
+        rows = read_json_rows(table_path, max_rows, max_cols, data)
+    else:
+        msg = f"Unsupported table format {suffix} of the file {table_path.name}"
+        raise NotImplementedError(msg)
+
+    return normalize_rows(rows, max_cols)
@@ -0,0 +1,166 @@
+import json
+import os
+import socket
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+from journal import append_entry
+
+QUEUE_DIR_NAME = "queue"
+
+# Layout of the queue directory shared by all workers:
+# init.lock                    created by the worker that creates the queue
+# pending/000001.json          task waiting to be claimed
+# claimed/000001.json.<worker> task that is being converted by the worker
+# done/000001.json             task that was converted, successfully or not
+# reports/<worker>.jsonl       outcomes of the tasks converted by the worker
+
+
+def get_queue_dir(workdir: Path) -> Path:
+    return workdir / QUEUE_DIR_NAME
+
+
+def get_worker_id() -> str:
+    return socket.gethostname() + "-" + str(os.getpid())
+
+
+def init_queue(queue_dir: Path, input_output_map: Dict[Path, Path]) -> bool:
+    """Creates task files for all datasets. When several workers start
+    at the same time only the one that creates init.lock writes the tasks,
+    the others wait until pending/ appears. Returns True if this worker created the queue.
+    """
+    pending_dir = queue_dir / "pending"
+    if pending_dir.exists():
+        return False
+    queue_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(str(queue_dir / "init.lock"), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.close(fd)
+    except FileExistsError:
+        wait_for_queue(pending_dir)
+        return False
+
+    for sub_dir in ("claimed", "done", "reports"):
+        (queue_dir / sub_dir).mkdir(exist_ok=True)
+    # tasks are written into a private directory that is renamed to pending/
+    # only when complete, so workers never see a partially created queue
+    tmp_dir = queue_dir / ("pending.tmp." + get_worker_id())
+    tmp_dir.mkdir()
+    for i, (input_dir, out_dir) in enumerate(input_output_map.items(), 1):
+        task = {"input_dir": str(input_dir), "output_dir": str(out_dir)}
+        with open(tmp_dir / f"{i:06d}.json", "w", encoding="utf-8") as s:
+            json.dump(task, s)
+    os.rename(tmp_dir, pending_dir)
+    return True
+
+
+def wait_for_queue(pending_dir: Path, timeout: float = 120):
+    waited = 0
+    while not pending_dir.exists():
+        if waited >= timeout:
+            msg = (
+                f"The work queue {str(pending_dir.parent)} was not created in time. "
+                + "If the worker that was creating it has stopped,"
+                + " remove the queue directory and start the workers again."
+            )
+            raise TimeoutError(msg)
+        time.sleep(1)
+        waited += 1
+
+
+def claim_task(queue_dir: Path, worker_id: str) -> Union[None, Tuple[str, Path, Path]]:
+    """Returns (task name, input dir, output dir) of the claimed task
+    or None if there are no pending tasks left.
+    """
+    pending_dir = queue_dir / "pending"
+    for task_name in sorted(os.listdir(pending_dir)):
+        claimed_path = queue_dir / "claimed" / (task_name + "." + worker_id)
+        try:
+            os.rename(pending_dir / task_name, claimed_path)
+        except FileNotFoundError:
+            # claimed by another worker
+            continue
+        with open(claimed_path, "r", encoding="utf-8") as s:
+            task = json.load(s)
+        return task_name, Path(task["input_dir"]), Path(task["output_dir"])
+    return None
+
+
+def complete_task(
+    queue_dir: Path,
+    worker_id: str,
+    task_name: str,
+    input_dir: Path,
+    out_dir: Path,
+    outcome: str,
+    error: Union[None, str] = None,
+    tr: Union[None, str] = None,
+):
+    report_path = queue_dir / "reports" / (worker_id + ".jsonl")
+    entry = {
+        "task": task_name,
+        "input_dir": str(input_dir),
+        "output_dir": str(out_dir),
+        "outcome": outcome,
+        "worker": worker_id,
+    }
+    if error is not None:
+        entry["error"] = error
+        entry["traceback"] = tr
+    append_entry(report_path, entry)
+    claimed_path = queue_dir / "claimed" / (task_name + "." + worker_id)
+    os.rename(claimed_path, queue_dir / "done" / task_name)
+
+
+def requeue_claimed_tasks(queue_dir: Path) -> int:
+    """Returns tasks of the workers that were interrupted back to pending.
+    Must be used only when no workers are running.
+    """
+    num_requeued = 0
+    claimed_dir = queue_dir / "claimed"
+    for claimed_name in os.listdir(claimed_dir):
+        task_name = claimed_name.split(".json.")[0] + ".json"
+        os.rename(claimed_dir / claimed_name, queue_dir / "pending" / task_name)
+        num_requeued += 1
+    return num_requeued
+
+
+def count_tasks(queue_dir: Path) -> Dict[str, int]:
+    return {
+        state: len(os.listdir(queue_dir / state))
+        for state in ("pending", "claimed", "done")
+    }
+
+
+def merge_reports(queue_dir: Path) -> Dict[str, dict]:
+    """Returns {task name: entry} with the latest outcome of each task
+    collected from the reports of all workers.
+    """
+    outcomes = dict()
+    report_paths = sorted((queue_dir / "reports").glob("*.jsonl"))
+    entries = []
+    for report_path in report_paths:
+        with open(report_path, "r", encoding="utf-8") as s:
+            for line in s:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    for entry in sorted(entries, key=lambda e: e["time"]):
+        outcomes[entry["task"]] = entry
+    return outcomes
+
+
+def get_failed_tasks(
+    outcomes: Dict[str, dict], outcome: str = "failed"
+) -> List[Tuple[str, str, str]]:
+    """Returns [(input dir, error, traceback)] of the tasks with the outcome,
+    failed or timed_out, in the order of input.xlsx
+    """
+    failed = []
+    for task_name in sorted(outcomes.keys()):
+        entry = outcomes[task_name]
+        if entry["outcome"] == outcome:
+            failed.append((entry["input_dir"], entry["error"], entry["traceback"]))
+    return failed
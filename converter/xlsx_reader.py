@@ -0,0 +1,101 @@
+import io
+from pathlib import Path
+from typing import Any, List, Tuple, Union
+
+# same strings that pandas.read_excel treats as missing values
+NA_VALUES = {
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+}
+
+
+def is_missing(value: Any) -> bool:
+    if value is None:
+        return True
+    elif isinstance(value, float):
+        return value != value  # NaN
+    elif isinstance(value, str):
+        return value in NA_VALUES
+    return False
+
+
+def is_empty_row(row: Tuple[Any, ...]) -> bool:
+    return all(is_missing(v) for v in row)
+
+
+def cell_to_str(value: Any) -> str:
+    # whole numbers are stored in xlsx as floats, pandas reads them as int
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def normalize_rows(
+    rows: List[Tuple[Any, ...]], max_cols: Union[None, int] = None
+) -> List[Tuple[Any, ...]]:
+    """Drops trailing empty rows and pads rows with None to the same length"""
+    rows = list(rows)
+    while rows != [] and is_empty_row(rows[-1]):
+        rows.pop()
+    row_len = max((len(row) for row in rows), default=0)
+    if max_cols is not None:
+        row_len = max_cols
+    rows = [tuple(row) + (None,) * (row_len - len(row)) for row in rows]
+    return rows
+
+
+def read_xlsx_rows(
+    xlsx_path: Path,
+    max_rows: Union[None, int] = None,
+    max_cols: Union[None, int] = None,
+    data: Union[None, bytes] = None,
+) -> List[Tuple[Any, ...]]:
+    """Streams rows of the first sheet with openpyxl in read-only mode.
+    Rows are normalized with normalize_rows. data, if provided,
+    is the content of the file that was already read.
+    """
+    import openpyxl
+
+    source = xlsx_path if data is None else io.BytesIO(data)
+    wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        rows = list(ws.iter_rows(max_row=max_rows, max_col=max_cols, values_only=True))
+    finally:
+        wb.close()
+
+    return normalize_rows(rows, max_cols)
+
+
+def select_columns(
+    rows: List[Tuple[Any, ...]], col_names: List[str]
+) -> Tuple[List[str], List[List[Any]]]:
+    """Uses the first row as the header.
+    Returns (names of absent columns, [values of each requested column])
+    """
+    if rows == []:
+        return list(col_names), []
+    header = [None if is_missing(h) else str(h) for h in rows[0]]
+    absent_cols = [col for col in col_names if col not in header]
+    if absent_cols != []:
+        return absent_cols, []
+    col_ids = [header.index(col) for col in col_names]
+    columns = [[row[i] for row in rows[1:]] for i in col_ids]
+    return [], columns
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
-import json
 import re
+import sys
 from argparse import ArgumentParser
 from collections import defaultdict
 from dataclasses import dataclass
@@ -9,6 +9,10 @@ from pathlib import Path
 from pprint import pformat, pprint
 from typing import Any, Dict, Iterable, List, Set
 
+# json i/o is shared with the converter
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent / "converter"))
+from json_codec import read_json_file, write_json_file  # noqa: E402
+
 cycle_dir_pattern = re.compile(r"(?P<t1>Cyc)(?P<cycle>\d+)(?P<t2>_reg)(?P<region>\d+)")
 h_and_e_dir_pattern = re.compile(r"(?P<t1>HandE_reg)(?P<region>\d+)")
 image_or_bcf_pattern = re.compile(r"(?P<region>\d+)(?P<rest>.+)")
@@ -94,8 +98,7 @@ class DatasetFixer:
                 self.rename(image_dir, new_dir)
 
     def get_corrected_metadata(self) -> Dict[str, Any]:
-        with open(self.dataset_dir / experiment_json_path) as f:
-            experiment_metadata = json.load(f)
+        experiment_metadata = read_json_file(self.dataset_dir / experiment_json_path)
 
         dataset_raw_dir = self.dataset_dir / raw_dir
         disk_cycles_by_region = defaultdict(set)
@@ -169,8 +172,7 @@ class DatasetFixer:
             channel_names_file = self.find_channel_names_file()
 
             print("Writing new", experiment_json_file)
-            with open(experiment_json_file, "w") as f:
-                json.dump(corrected_metadata, f, indent=4)
+            write_json_file(experiment_json_file, corrected_metadata, indent=4)
 
             print("Writing new", channel_names_file)
             with open(channel_names_file, "w") as f: